@@ -17,6 +17,7 @@ from telegram.ext import (
     MessageHandler,
     Filters,
     CallbackQueryHandler,
+    InlineQueryHandler,
     Job,
 )
 from settings import *
@@ -28,7 +29,9 @@ logging.basicConfig(
 )
 
 from menu import BaseState as State
-from utils import upd_news, update_clusters, set_hot_news, get_other_hot_news
+from utils import get_other_hot_news, refresh_snapshots, category_names
+from utils.news import suggest_headlines, search_archive
+from utils.storage import link_hash
 
 log = logging.getLogger(__name__)
 
@@ -39,13 +42,11 @@ def error(bot, update, error):
 
 
 def update_all(bot, update):
-    upd_news()
-    for category in ['Kremlin', 'Megafon']:
-        update_clusters(category)
-        set_hot_news(category)
+    from utils.pipeline import run_pipeline
+    run_pipeline()
     log.info('Updated all!')
 
-from utils import send_async_message, edit_async_message_markup
+from utils import send_async_message, edit_async_message_markup, async
 # from utils import langs
 from utils import get_other_hot_news
 
@@ -53,20 +54,49 @@ from utils import get_other_hot_news
 
 
 def button(bot, update):
-    if update.callback_query.data == _('MORE_BUTTON'):
-        headers = get_other_hot_news()
+    action, sep, category = update.callback_query.data.partition(':')
+    if action == 'More':
+        headers = get_other_hot_news(category or category_names()[0])
         edit_async_message_markup(bot, update, markup='')
         send_async_message(bot, update, text=headers, parse_mode=telegram.ParseMode.HTML, disable_web_page_preview=1)
     else:
         edit_async_message_markup(bot, update, markup='')
 
 
+@async
+def search(bot, update, args):
+    text = search_archive(' '.join(args))
+    send_async_message(bot, update, text=text, parse_mode=telegram.ParseMode.HTML, disable_web_page_preview=1)
+
+
+def inline_query(bot, update):
+    results = [
+        telegram.InlineQueryResultArticle(
+            id=link_hash(news[2]),
+            title=news[0],
+            description='%s, %s' % (news[6], news[5].strftime('%Y-%m-%d %H:%M')),
+            url=news[2],
+            input_message_content=telegram.InputTextMessageContent(
+                text,
+                parse_mode=telegram.ParseMode.HTML,
+                disable_web_page_preview=True,
+            ),
+        )
+        for category, news, text in suggest_headlines(update.inline_query.query)
+    ]
+    bot.answerInlineQuery(update.inline_query.id, results, cache_time=INLINE_CACHE_TIME)
+
+
 updater = Updater(BOT_TOKEN)
 updater.dispatcher.add_handler(MessageHandler(Filters.text, State))
 updater.dispatcher.add_handler(CommandHandler('start', State))
+updater.dispatcher.add_handler(CommandHandler('search', search, pass_args=True))
 updater.dispatcher.add_error_handler(error)
 updater.dispatcher.add_handler(CallbackQueryHandler(button))
+updater.dispatcher.add_handler(InlineQueryHandler(inline_query))
 
 job_queue = updater.job_queue
-job_queue.put(Job(update_all, 7200.0), next_t=7200.0)
+if REFRESH_IN_BOT:
+    job_queue.put(Job(update_all, float(REFRESH_INTERVAL)), next_t=float(REFRESH_INTERVAL))
+job_queue.put(Job(refresh_snapshots, float(SNAPSHOT_POLL_INTERVAL)), next_t=0.0)
 
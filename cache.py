@@ -204,6 +204,100 @@ class AllowedPhoneList(RedisCache):
         return self.check(phone)
 
 
+class DigestCache(RedisCache):
+    """ Pre-rendered news digests keyed by snapshot version """
+
+    def __init__(self, prefix='digest', **kwargs):
+        super(DigestCache, self).__init__(prefix=prefix, kwargs=kwargs)
+
+    def key(self, category, version, page):
+        return ':'.join((self._key_prefix, category, str(version), page))
+
+    def get(self, category, version, page):
+        return self._redis.get(self.key(category, version, page))
+
+    def set(self, category, version, page, text, timeout=None):
+        self._redis.set(self.key(category, version, page), text, ex=timeout)
+
+    def expire(self, category, version, page, timeout):
+        self._redis.expire(self.key(category, version, page), timeout)
+
+
+class SnapshotVersions(RedisCache):
+    """ Versions of news snapshots published by the refresh worker """
+
+    def __init__(self, prefix='snapshot', **kwargs):
+        super(SnapshotVersions, self).__init__(prefix=prefix, kwargs=kwargs)
+
+    def key(self, category):
+        return ':'.join((self._key_prefix, category))
+
+    def get(self, category):
+        return self._redis.get(self.key(category))
+
+    def set(self, category, version):
+        self._redis.set(self.key(category), version)
+
+
+class SnapshotFrames(RedisCache):
+    """ Serialized news snapshot frames keyed by snapshot version """
+
+    def __init__(self, prefix='snapshot-frame', **kwargs):
+        super(SnapshotFrames, self).__init__(prefix=prefix, kwargs=kwargs)
+
+    def key(self, category, version):
+        return ':'.join((self._key_prefix, category, str(version)))
+
+    def get(self, category, version):
+        return self._redis.get(self.key(category, version))
+
+    def set(self, category, version, payload):
+        self._redis.set(self.key(category, version), payload)
+
+    def expire(self, category, version, timeout):
+        self._redis.expire(self.key(category, version), timeout)
+
+
+class SearchRequests(RedisCache):
+    """ /search queries of bot processes answered by the refresh worker """
+
+    def __init__(self, prefix='search', **kwargs):
+        super(SearchRequests, self).__init__(prefix=prefix, kwargs=kwargs)
+
+    def queue_key(self):
+        return ':'.join((self._key_prefix, 'requests'))
+
+    def reply_key(self, request_id):
+        return ':'.join((self._key_prefix, 'reply', request_id))
+
+    def push(self, request_id, query, timeout):
+        """ Queues `query` for the worker, it is dropped unless answered
+        within `timeout` seconds
+        """
+        request = pickle.dumps((request_id, query, time.time() + timeout), pickle.HIGHEST_PROTOCOL)
+        with self._redis.pipeline() as pipe:
+            pipe.rpush(self.queue_key(), request)
+            pipe.expire(self.queue_key(), timeout)
+            pipe.execute()
+
+    def pop(self, timeout):
+        """ Returns the next (request_id, query, deadline) or `None` """
+        item = self._redis.blpop(self.queue_key(), timeout)
+        return pickle.loads(item[1]) if item else None
+
+    def reply(self, request_id, answer, timeout):
+        key = self.reply_key(request_id)
+        with self._redis.pipeline() as pipe:
+            pipe.rpush(key, pickle.dumps(answer, pickle.HIGHEST_PROTOCOL))
+            pipe.expire(key, timeout)
+            pipe.execute()
+
+    def wait(self, request_id, timeout):
+        """ Returns the answer to `request_id` or `None` after `timeout` """
+        item = self._redis.blpop(self.reply_key(request_id), timeout)
+        return pickle.loads(item[1]) if item else None
+
+
 class BaseContext(RedisCache):
 
     def __init__(self, chat_id, persist_prefix, tmp_prefix, **kwargs):
@@ -437,6 +531,26 @@ class Context(BaseContext):
         self.p_set_('state', n, timeout=timeout, persistent=False)
         self.p_set_('last_seen', datetime.utcnow())
 
+    # Link hashes of news already sent to the chat, one set per category
+
+    def seen_key(self, category):
+        return ':'.join((self.key(False), 'seen', category))
+
+    def get_seen(self, category, hashes):
+        key = self.seen_key(category)
+        for link_hash in hashes:
+            self.pipeline.sismember(key, link_hash)
+        return self.apply()
+
+    def p_set_seen(self, category, link_hash, timeout=None):
+        key = self.seen_key(category)
+        self.pipeline.sadd(key, link_hash)
+        if timeout is not None:
+            self.pipeline.expire(key, timeout)
+
+    def reset_seen(self, category, hashes):
+        self._redis.srem(self.seen_key(category), *hashes)
+
 
 
 
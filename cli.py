@@ -9,6 +9,43 @@ def start_bot():
     updater.idle()
 
 
+def start_worker():
+    import logging
+    logging.basicConfig(
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        level=logging.INFO
+    )
+    from utils.pipeline import run_worker
+    run_worker()
+
+
+def relemmatize(workers=None):
+    from utils.refresh import relemmatize_archive
+    from utils.categories import category_names
+    for category in category_names():
+        relemmatize_archive(category, workers=workers)
+
+
+def compact(retention_days=None):
+    from utils.refresh import compact_archive
+    from utils.categories import category_names
+    for category in category_names():
+        compact_archive(category, retention_days=retention_days)
+
+
+def build_index():
+    from utils.refresh import build_search_index
+    from utils.categories import category_names
+    for category in category_names():
+        build_search_index(category)
+
+
+def benchmark(name):
+    import logging
+    logging.basicConfig(level=logging.INFO)
+    from utils.bench import run_benchmark
+    run_benchmark(name)
+
 
 
 def run():
@@ -34,7 +71,67 @@ def run():
         default=False
     )
 
+    parser.add_option(
+        '--worker',
+        help='Start news refresh worker',
+        action='store_true',
+        default=False
+    )
+
+    parser.add_option(
+        '--relemmatize',
+        help='Recompute lemmas of the whole news archive',
+        action='store_true',
+        default=False
+    )
+
+    parser.add_option(
+        '--workers',
+        help='Number of worker processes',
+        type='int',
+        default=None
+    )
+
+    parser.add_option(
+        '--compact-archive',
+        help='Merge old archive partitions into daily and monthly ones',
+        action='store_true',
+        default=False
+    )
+
+    parser.add_option(
+        '--retention-days',
+        help='With --compact-archive drop partitions older than DAYS',
+        metavar='DAYS',
+        type='int',
+        default=None
+    )
+
+    parser.add_option(
+        '--build-search-index',
+        help='Index the whole news archive for /search',
+        action='store_true',
+        default=False
+    )
+
+    parser.add_option(
+        '--bench',
+        help='Run benchmark NAME',
+        metavar='NAME',
+        default=None
+    )
+
     opts, args = parser.parse_args(sys.argv[1:])
+    if opts.bench is not None:
+        benchmark(opts.bench)
+    if opts.relemmatize is True:
+        relemmatize(opts.workers)
+    if opts.compact_archive is True:
+        compact(opts.retention_days)
+    if opts.build_search_index is True:
+        build_index()
+    if opts.worker is True:
+        start_worker()
     if opts.run is True:
         start_bot()
 
@@ -0,0 +1,3 @@
+#!/bin/bash
+msgfmt -o ./locale/ru/LC_MESSAGES/onobot.mo ./locale/ru/LC_MESSAGES/onobot.po
+python3 cli.py --worker 2>&1 | tee -a log/worker.log
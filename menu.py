@@ -12,6 +12,7 @@ from utils import (
     get_hot_news,
     get_rare,
 )
+from utils.categories import categories
 
 from functools import wraps
 import logging
@@ -167,11 +168,7 @@ class MainMenuState(BaseState):
             text=_('MAIN_MENU_STATE_TEXT')
 
         markup = telegram.ReplyKeyboardMarkup(
-            [[
-                telegram.KeyboardButton(_('KREMLIN_STATE_TEXT')),
-            ], [
-                telegram.KeyboardButton(_('MEGAFON_STATE_TEXT')),
-            ]],
+            [[telegram.KeyboardButton(_(category.button))] for category in categories.values()],
             resize_keyboard=True,
         )
 
@@ -189,13 +186,11 @@ class MainMenuState(BaseState):
                value=value,
            )
         )
-        if value == _('KREMLIN_STATE_TEXT'):
-            log.info(type(value))
-            log.info('!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!')
-            self.new_state(KremlinMenuState)
-        elif value == _('MEGAFON_STATE_TEXT'):
-            self.new_state(MegafonMenuState)
-        elif value == '/start':
+        for category in categories.values():
+            if value == _(category.button):
+                self.new_state(globals()[category.state_name])
+                return
+        if value == '/start':
             self.on_enter('qazxswedc')
 
 
@@ -236,29 +231,30 @@ class BaseOptionMenuState(BaseState):
             return v
 
 
-class KremlinMenuState(BaseOptionMenuState):
-    @back_button
-    def on_input(self, value):
-        button = super(KremlinMenuState, self).on_input(value)
-        category = 'Kremlin'
-        send_news(self.bot, self.update, category, button)
+class CategoryMenuState(BaseOptionMenuState):
+    """ News menu of `category`, subclassed for every registered one """
 
+    category = None
 
-class MegafonMenuState(BaseOptionMenuState):
     @back_button
     def on_input(self, value):
-        button = super(MegafonMenuState, self).on_input(value)
-        category = 'Megafon'
-        send_news(self.bot, self.update, category, button)
+        button = super(CategoryMenuState, self).on_input(value)
+        send_news(self.bot, self.update, self.category, button)
+
+
+# Session states are stored by class name, so every category gets its
+# own `<Name>MenuState` class
+for category in categories.values():
+    globals()[category.state_name] = type(category.state_name, (CategoryMenuState,), dict(category=category.name))
 
 
 def send_news(bot, update, category, button):
     if button == 0:
-        text = get_random_news(category)
+        text = get_random_news(category, chat_id=update.message.chat_id)
         send_async_message(bot, update, text=text, parse_mode=telegram.ParseMode.HTML, disable_web_page_preview=1)
     elif button == 1:
         text = get_hot_news(category)
-        more_keyboard = telegram.InlineKeyboardMarkup([[telegram.InlineKeyboardButton(_('MORE_BUTTON'), callback_data='More')]])
+        more_keyboard = telegram.InlineKeyboardMarkup([[telegram.InlineKeyboardButton(_('MORE_BUTTON'), callback_data='More:%s' % category)]])
         send_async_message(bot, update, text=text, markup=more_keyboard, parse_mode=telegram.ParseMode.HTML, disable_web_page_preview=1)
     elif button == 2:
         text = get_rare(chat_id=update.message.chat_id, category=category)
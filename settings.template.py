@@ -9,4 +9,81 @@ DEFAULT_TIMEZONE = 'Europe/Moscow'
 KREMLIN_NEWS_LOCATION = 'data/kremlin_news.csv'
 ALL_KREMLIN_NEWS_LOCATION = 'data/all_kremlin_news.csv'
 MEGAFON_NEWS_LOCATION = 'data/megafon_news.csv'
-ALL_MEGAFON_NEWS_LOCATION = 'data/all_megafon_news.csv'
\ No newline at end of file
+ALL_MEGAFON_NEWS_LOCATION = 'data/all_megafon_news.csv'
+
+CATEGORIES = [
+    dict(name='Kremlin', button='KREMLIN_STATE_TEXT',
+         location=KREMLIN_NEWS_LOCATION, archive_location=ALL_KREMLIN_NEWS_LOCATION),
+    dict(name='Megafon', button='MEGAFON_STATE_TEXT',
+         location=MEGAFON_NEWS_LOCATION, archive_location=ALL_MEGAFON_NEWS_LOCATION),
+]
+
+RSS_FETCH_WORKERS = 8
+RSS_FETCH_TIMEOUT = 10
+
+FEEDS = [
+    dict(url='http://interfax.ru/rss.asp', category='Kremlin'),
+    dict(url='https://lenta.ru/rss', category='Kremlin'),
+    dict(url='http://tass.ru/rss/v2.xml', category='Kremlin'),
+    dict(url='https://news.rambler.ru/rss/head/', category='Kremlin'),
+    dict(url='https://russian.rt.com/rss', category='Kremlin'),
+    dict(url='https://meduza.io/rss/news', category='Megafon'),
+    dict(url='https://vedomosti.ru/rss/news', category='Megafon'),
+    dict(url='https://www.svoboda.org/api/z-pqpiev-qpp', category='Megafon'),
+    dict(url='https://www.kommersant.ru/RSS/news.xml', category='Megafon'),
+    dict(url='https://republic.ru/export/news.xml', category='Megafon'),
+    dict(url='https://tvrain.ru/export/rss/programs/1018.xml', category='Megafon', interval=60 * 60 * 2),
+]
+FEED_STATE_LOCATION = 'data/feeds.json'
+FEED_INTERVAL = 60 * 30
+FEED_MIN_INTERVAL = 60 * 5
+FEED_MAX_INTERVAL = 60 * 60 * 6
+FEED_TARGET_ITEMS = 5
+
+ARTICLE_DOWNLOAD_WORKERS = 16
+ARTICLE_HOST_CONNECTIONS = 2
+ARTICLE_DOWNLOAD_TIMEOUT = 15
+
+LEMMA_CACHE_SIZE = 200000
+LEMMATIZE_WORKERS = 4
+LEMMATIZE_CHUNKSIZE = 16
+
+NEWS_STORAGE_BACKEND = 'feather'
+BODY_COMPRESSION = 6
+
+DIGEST_TIMEOUT = 60 * 60 * 24
+
+CLUSTER_ENGINE = 'birch'
+CLUSTER_SVD_COMPONENTS = 100
+CLUSTER_BIRCH_THRESHOLD = 0.8
+CLUSTER_MEAN_SIZE = 10
+CLUSTER_ASSIGN_SIMILARITY = 0.5
+CLUSTER_REBUILD_INTERVAL = 60 * 60 * 24
+
+HOTNESS_SCORER = 'default'
+RARE_EXCLUDE_TERMS = ['Порошенко', 'Украин', 'Трамп']
+RARE_CLUSTER_COUNT = 10
+
+SEEN_SAMPLES = 4
+SEEN_TIMEOUT = 60 * 60 * 24
+
+SEARCH_INDEX_LOCATION = 'data/search.db'
+SEARCH_RESULTS = 10
+SEARCH_TIMEOUT = 10
+
+INLINE_RESULTS = 10
+INLINE_CACHE_SIZE = 1000
+INLINE_CACHE_TIME = 60
+
+DEDUP_NUM_PERM = 64
+DEDUP_BANDS = 16
+DEDUP_THRESHOLD = 0.6
+DEDUP_WINDOW = 60 * 60 * 24
+
+PIPELINE_STATE_LOCATION = 'data/pipeline.json'
+
+SNAPSHOT_TIMEOUT = 60 * 10
+SNAPSHOT_POLL_INTERVAL = 60
+
+REFRESH_IN_BOT = False
+REFRESH_INTERVAL = 60
@@ -0,0 +1,2 @@
+#!/bin/bash
+python3 cli.py --worker 2>&1 | tee -a log/worker.log
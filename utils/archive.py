@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+
+import os
+import tempfile
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from .storage import NEWS_COLUMNS, get_storage, link_hash
+
+import logging
+log = logging.getLogger(__name__)
+
+
+DAY_FORMAT = '%Y-%m-%d'
+MONTH_FORMAT = '%Y-%m'
+CHUNK_FORMAT = '%s_%04d'
+
+
+class NewsArchive(object):
+    """ All-time news archive stored as append-only partitions.
+
+    `ALL_*_NEWS_LOCATION` without extension becomes a directory with
+    one table per append (`2017-03-01_0001.feather`), daily and monthly
+    tables the chunks of past days are merged into (`2017-03-01.feather`,
+    `2017-02.feather`) and `links.idx`, a file with a `hash partition`
+    line per archived link used for dedup. An append writes a new chunk
+    and then the tail of the index; a chunk left unindexed by a crash
+    in between is indexed when the index is loaded.
+    """
+
+    index_name = 'links.idx'
+
+    def __init__(self, location):
+        self.location = location
+        self.directory = os.path.splitext(location)[0]
+        self.index_path = os.path.join(self.directory, self.index_name)
+        self._links = None
+
+    def __repr__(self):
+        return '<%s(%s)>' % (type(self).__name__, self.directory)
+
+    def partition(self, name):
+        return get_storage(os.path.join(self.directory, name))
+
+    def partitions(self):
+        """ Returns sorted partition names, oldest first """
+        if not os.path.isdir(self.directory):
+            return []
+        extension = self.partition('_').extension
+        return sorted(
+            os.path.splitext(name)[0] for name in os.listdir(self.directory)
+            if name.endswith(extension) and not name.startswith('.')
+        )
+
+    def _chunks(self, names=None):
+        return [name for name in (self.partitions() if names is None else names) if len(name) > 10]
+
+    @property
+    def links(self):
+        if self._links is None:
+            self._migrate()
+            self._links = set()
+            last = None
+            if os.path.exists(self.index_path):
+                with open(self.index_path) as f:
+                    for line in f:
+                        fields = line.split()
+                        if fields:
+                            self._links.add(fields[0])
+                            last = fields[1] if len(fields) > 1 else last
+            chunks = self._chunks()
+            if chunks and (last is None or chunks[-1] > last):
+                log.warning('Indexing unindexed partition %s of %r' % (chunks[-1], self))
+                hashes = [link_hash(link) for link in self.partition(chunks[-1]).load(columns=['link'])['link'].values]
+                self._write_index([(h, chunks[-1]) for h in hashes])
+                self._links.update(hashes)
+        return self._links
+
+    def _write_index(self, entries, rebuild=False):
+        """ Writes (hash, partition) `entries` to the end of the index,
+        or replaces the index with them if `rebuild` is set
+        """
+        lines = ('%s %s\n' % entry for entry in entries)
+        if not rebuild:
+            with open(self.index_path, 'a') as f:
+                f.writelines(lines)
+                f.flush()
+                os.fsync(f.fileno())
+            return
+        fd, tmp = tempfile.mkstemp(prefix='.', dir=self.directory)
+        with os.fdopen(fd, 'w') as f:
+            f.writelines(lines)
+        os.replace(tmp, self.index_path)
+
+    def _migrate(self):
+        """ Splits a legacy single-file archive into daily partitions """
+        if os.path.isdir(self.directory):
+            return
+        legacy = get_storage(self.location).load()
+        os.makedirs(self.directory)
+        if legacy.empty:
+            return
+        log.info('Migrating %s to %r' % (self.location, self))
+        legacy.drop_duplicates('link', inplace=True)
+        days = legacy['date'].dt.strftime(DAY_FORMAT)
+        for day, df in legacy.groupby(days):
+            self.partition(day).save(df)
+        self._write_index(zip((link_hash(link) for link in legacy['link'].values), days.values))
+
+    def _merge(self, groups):
+        """ Merges the partitions of every `groups` item into its key """
+        for target, parts in sorted(groups.items()):
+            if parts == [target]:
+                continue
+            df = pd.concat([self.partition(name).load() for name in parts], ignore_index=True)
+            df.drop_duplicates('link', inplace=True)
+            self.partition(target).save(df)
+            for name in parts:
+                if name != target:
+                    os.remove(self.partition(name).path)
+            log.info('Merged %d partitions into %s of %r' % (len(parts), target, self))
+
+    def append(self, df):
+        """ Writes unseen rows of `df` to a new partition of today """
+        links = self.links
+        hashes = [link_hash(link) for link in df['link'].values]
+        mask = [h not in links for h in hashes]
+        new = df[mask].drop_duplicates('link')
+        if new.empty:
+            return 0
+
+        today = datetime.now().strftime(DAY_FORMAT)
+        past = {}
+        for name in self.partitions():
+            if len(name) > 7 and name[:10] < today:
+                past.setdefault(name[:10], []).append(name)
+        self._merge(past)
+        chunks = self._chunks()
+        name = CHUNK_FORMAT % (today, max([int(name[11:]) for name in chunks if name[:10] == today] or [0]) + 1)
+
+        # partition first: a crash before the index is written is
+        # repaired when the index is loaded, never archiving rows twice
+        self.partition(name).save(new)
+        new_hashes = [link_hash(link) for link in new['link'].values]
+        self._write_index((h, name) for h in new_hashes)
+        links.update(new_hashes)
+        log.info('Archived %d news to %s of %r' % (len(new), name, self))
+        return len(new)
+
+    def __contains__(self, link):
+        return link_hash(link) in self.links
+
+    def load(self, since=None):
+        """ Returns archived news, optionally only partitions from `since` on """
+        self._migrate()
+        names = self.partitions()
+        if since is not None:
+            day, month = since.strftime(DAY_FORMAT), since.strftime(MONTH_FORMAT)
+            names = [name for name in names if name >= (day if len(name) > 7 else month)]
+        frames = [self.partition(name).load() for name in names]
+        if not frames:
+            return pd.DataFrame(columns=NEWS_COLUMNS)
+        return pd.concat(frames, ignore_index=True)
+
+    def rewrite(self, func):
+        """ Replaces every partition `df` with `func(df)` """
+        self._migrate()
+        for name in self.partitions():
+            partition = self.partition(name)
+            partition.save(func(partition.load()))
+
+    def compact(self, retention_days=None):
+        """ Drops partitions older than `retention_days`, merges partitions
+        of past months into monthly ones and the rest of past days into
+        daily ones. Rebuilds the index.
+        """
+        self._migrate()
+        names = self.partitions()
+
+        if retention_days is not None:
+            cutoff = datetime.now() - timedelta(days=retention_days)
+            day, month = cutoff.strftime(DAY_FORMAT), cutoff.strftime(MONTH_FORMAT)
+            for name in names:
+                if (len(name) > 7 and name[:10] < day) or (len(name) == 7 and name < month):
+                    os.remove(self.partition(name).path)
+                    log.info('Dropped partition %s of %r' % (name, self))
+            names = self.partitions()
+
+        today = datetime.now().strftime(DAY_FORMAT)
+        this_month = today[:7]
+        groups = {}
+        for name in names:
+            if name[:7] < this_month:
+                groups.setdefault(name[:7], []).append(name)
+            elif name[:10] < today:
+                groups.setdefault(name[:10], []).append(name)
+        self._merge(groups)
+
+        entries = []
+        for name in self.partitions():
+            entries.extend((link_hash(link), name) for link in self.partition(name).load(columns=['link'])['link'].values)
+        self._write_index(entries, rebuild=True)
+        self._links = set(h for h, _ in entries)
+
+
+_archives = {}
+
+
+def get_archive(location):
+    """ Returns shared `NewsArchive` so its link index is loaded once """
+    if location not in _archives:
+        _archives[location] = NewsArchive(location)
+    return _archives[location]
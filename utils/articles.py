@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from newspaper import Article
+
+from settings import (
+    ARTICLE_DOWNLOAD_WORKERS,
+    ARTICLE_HOST_CONNECTIONS,
+    ARTICLE_DOWNLOAD_TIMEOUT,
+)
+
+import logging
+log = logging.getLogger(__name__)
+
+
+class ArticleDownloader(object):
+    """ Downloads and parses full article texts on a worker pool.
+
+    `workers` caps the total number of concurrent downloads and
+    `host_connections` caps the number of concurrent downloads from
+    the same host, so a burst of links from one media does not get
+    us throttled.
+    """
+
+    def __init__(self, workers=ARTICLE_DOWNLOAD_WORKERS,
+                 host_connections=ARTICLE_HOST_CONNECTIONS,
+                 timeout=ARTICLE_DOWNLOAD_TIMEOUT):
+        self.workers = workers
+        self.timeout = timeout
+        self._hosts = defaultdict(
+            lambda: threading.BoundedSemaphore(host_connections)
+        )
+        self._lock = threading.Lock()
+
+    def _host_semaphore(self, link):
+        with self._lock:
+            return self._hosts[urlsplit(link).netloc]
+
+    def download(self, link):
+        """ Returns article text or empty string on failure """
+        article = Article(link, language='ru', request_timeout=self.timeout)
+        with self._host_semaphore(link):
+            try:
+                article.download()
+            except Exception as err:
+                log.warning('Failed to download %(link)s: %(err)s' % vars())
+                return ''
+        try:
+            article.parse()
+        except Exception:
+            return ''
+        return article.text
+
+    def download_all(self, links):
+        """ Returns dict link -> article text """
+        links = list(links)
+        if not links:
+            return {}
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            return dict(zip(links, pool.map(self.download, links)))
+
+
+downloader = ArticleDownloader()
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+
+import os
+import random
+import shutil
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+import numpy as np
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.metrics import adjusted_rand_score
+
+from . import refresh
+from .news import _load_news
+from .refresh import get_cl
+from .search import SearchIndex
+from .categories import Category, categories
+from .vectors import cluster_texts
+from .clustering import ENGINES, get_clusterer, project
+from .ranking import centroid_medoids
+
+import logging
+log = logging.getLogger(__name__)
+
+
+def timeit(func, *args, **kwargs):
+    start = time.perf_counter()
+    func(*args, **kwargs)
+    return time.perf_counter() - start
+
+
+def _synthetic_news(n, prefix):
+    date = datetime.now() - timedelta(hours=1)
+    return [
+        [header, header, 'https://example.com/%s/%d' % (prefix, i), '', '', date, 'Example']
+        for i, header in enumerate(_synthetic_headers(n))
+    ]
+
+
+class _StubDownloader(object):
+
+    def download_all(self, links):
+        return {link: 'text of %s' % link for link in links}
+
+
+def bench_refresh(sizes=(1000, 2000, 4000, 8000, 16000)):
+    """ Times `ingest_news` and `normalize_news` merging `n` candidates,
+    half of them already known, into a table of `n` rows of a scratch
+    category. Article downloads and lemmatization are stubbed out. The
+    time per row should stay flat as `n` grows.
+    """
+    directory = tempfile.mkdtemp()
+    index = SearchIndex(os.path.join(directory, 'search.db'))
+    stubs = dict(
+        downloader=_StubDownloader(),
+        normalize_texts=lambda texts, **kwargs: list(texts),
+        get_search_index=lambda: index,
+    )
+    originals = {name: getattr(refresh, name) for name in stubs}
+    results = []
+    try:
+        for name, stub in stubs.items():
+            setattr(refresh, name, stub)
+        for n in sizes:
+            category = 'Bench%d' % n
+            location = os.path.join(directory, category)
+            categories[category] = Category(category, None, location + '.csv', location + '_all.csv')
+            refresh.ingest_news(category, _synthetic_news(n, 'old'))
+            refresh.normalize_news(category)
+
+            medias = _synthetic_news(n // 2, 'old') + _synthetic_news(n // 2, 'new')
+            ingest = timeit(refresh.ingest_news, category, medias)
+            normalize = timeit(refresh.normalize_news, category)
+            results.append((n, ingest, normalize))
+            log.info('refresh n=%d: ingest %.4fs, normalize %.4fs, %.2fus per row' % (
+                n, ingest, normalize, (ingest + normalize) / n * 1e6))
+    finally:
+        for name, original in originals.items():
+            setattr(refresh, name, original)
+        for n in sizes:
+            categories.pop('Bench%d' % n, None)
+        shutil.rmtree(directory)
+    return results
+
+
+def bench_clustering(category='Kremlin', engines=None):
+    """ Runs every clustering engine on the current `category` table and
+    compares its labels with the Ward `fcluster(..., 1.4)` reference by
+    adjusted Rand index, along with wall time and peak traced memory.
+    """
+    X = TfidfVectorizer().fit_transform(cluster_texts(_load_news(category)))
+    results = {}
+    reference = None
+    for name in ['ward'] + sorted(set(engines or ENGINES) - {'ward'}):
+        clusterer = get_clusterer(name)
+        tracemalloc.start()
+        start = time.perf_counter()
+        labels = clusterer.fit_predict(X)
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        if reference is None:
+            reference = labels
+        results[name] = dict(
+            time=elapsed,
+            peak_mb=peak / 2. ** 20,
+            clusters=len(np.unique(labels)),
+            ari=adjusted_rand_score(reference, labels),
+        )
+        log.info('clustering %s %s: %r' % (category, name, results[name]))
+    return results
+
+
+def _synthetic_headers(k, words=8):
+    vocabulary = ['слово%d' % i for i in range(200)]
+    return [' '.join(random.choice(vocabulary) for _ in range(words)) for _ in range(k)]
+
+
+def bench_medoid(sizes=(10, 20, 40, 80)):
+    """ Compares the Levenshtein medoid `get_cl` with the cosine to
+    centroid selector `centroid_medoids`, embedding time included.
+    """
+    results = []
+    for k in sizes:
+        headers = np.array(_synthetic_headers(k), dtype=object)
+        levenshtein = timeit(get_cl, headers)
+        start = time.perf_counter()
+        centroid_medoids(np.zeros(k), project(None, TfidfVectorizer().fit_transform(headers)))
+        centroid = time.perf_counter() - start
+        results.append((k, levenshtein, centroid))
+        log.info('medoid k=%d: levenshtein %.4fs, centroid %.4fs, x%.0f' % (
+            k, levenshtein, centroid, levenshtein / centroid))
+    return results
+
+
+BENCHMARKS = {
+    'refresh': bench_refresh,
+    'clustering': bench_clustering,
+    'medoid': bench_medoid,
+}
+
+
+def run_benchmark(name):
+    return BENCHMARKS[name]()
@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+
+import mmap
+import os
+import threading
+import zlib
+
+from .storage import atomic_write
+
+from settings import BODY_COMPRESSION
+
+import logging
+log = logging.getLogger(__name__)
+
+
+KEY_SIZE = 32
+
+
+class BodyStore(object):
+    """ Append-only store of article full texts next to a news table.
+
+    `<table>.bodies` holds records of the 32 character link hash and
+    the text, zlib compressed when that makes it shorter. The
+    `<table>.bodies.idx` index has a `hash offset length flag` line per
+    record. Readers map the data file and copy out only the requested
+    record; they pick up appended index lines lazily. `compact`
+    replaces both files, readers notice by the record hash not matching
+    and reload.
+    """
+
+    def __init__(self, location, compression=BODY_COMPRESSION):
+        base = os.path.splitext(location)[0]
+        self.path = base + '.bodies'
+        self.index_path = base + '.bodies.idx'
+        self.compression = compression
+        self._lock = threading.Lock()
+        self._map = None
+        self._reset()
+
+    def __repr__(self):
+        return '<%s(%s, records=%d)>' % (type(self).__name__, self.path, len(self._index))
+
+    def __len__(self):
+        with self._lock:
+            self._read_index()
+            return len(self._index)
+
+    def _reset(self):
+        if self._map is not None:
+            self._map.close()
+        self._map = None
+        self._index = {}
+        self._index_pos = 0
+        self._index_inode = None
+
+    def _read_index(self):
+        """ Reads index lines appended since the last call, all of them
+        if the index was replaced.
+        """
+        try:
+            inode = os.stat(self.index_path).st_ino
+        except OSError:
+            return
+        if inode != self._index_inode:
+            self._reset()
+            self._index_inode = inode
+        with open(self.index_path, 'rb') as f:
+            f.seek(self._index_pos)
+            data = f.read()
+        end = data.rfind(b'\n') + 1
+        for line in data[:end].splitlines():
+            key, offset, length, flag = line.split()
+            self._index[key.decode('ascii')] = (int(offset), int(length), flag == b'z')
+        self._index_pos += end
+
+    def _record(self, key):
+        offset, length, compressed = self._index[key]
+        if self._map is None or len(self._map) < offset + length:
+            if self._map is not None:
+                self._map.close()
+            with open(self.path, 'rb') as f:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        record = self._map[offset:offset + length]
+        if record[:KEY_SIZE] != key.encode('ascii'):
+            return None
+        return record[KEY_SIZE:], compressed
+
+    def get(self, key, default=None):
+        """ Returns text stored under link hash `key` """
+        with self._lock:
+            for attempt in range(2):
+                if key not in self._index:
+                    self._read_index()
+                if key not in self._index:
+                    return default
+                record = self._record(key)
+                if record is not None:
+                    break
+                self._reset()
+            else:
+                return default
+        payload, compressed = record
+        if compressed:
+            payload = zlib.decompress(payload)
+        return payload.decode('utf-8')
+
+    def _encode(self, key, text):
+        payload = text.encode('utf-8')
+        compressed = False
+        if self.compression:
+            packed = zlib.compress(payload, self.compression)
+            if len(packed) < len(payload):
+                payload, compressed = packed, True
+        return key.encode('ascii') + payload, compressed
+
+    def extend(self, items):
+        """ Appends (key, text) pairs whose keys are not stored yet """
+        with self._lock:
+            self._read_index()
+            directory = os.path.dirname(os.path.abspath(self.path))
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            lines = []
+            with open(self.path, 'ab') as data:
+                offset = data.seek(0, os.SEEK_END)
+                for key, text in items:
+                    if key in self._index:
+                        continue
+                    record, compressed = self._encode(key, text)
+                    data.write(record)
+                    lines.append('%s %d %d %s\n' % (key, offset, len(record), 'z' if compressed else '-'))
+                    self._index[key] = (offset, len(record), compressed)
+                    offset += len(record)
+                data.flush()
+                os.fsync(data.fileno())
+            if not lines:
+                return 0
+            with open(self.index_path, 'ab') as index:
+                index.write(''.join(lines).encode('ascii'))
+                index.flush()
+                os.fsync(index.fileno())
+            self._index_pos = os.path.getsize(self.index_path)
+            self._index_inode = os.stat(self.index_path).st_ino
+        return len(lines)
+
+    def compact(self, keys):
+        """ Rewrites the store keeping only records of `keys` """
+        with self._lock:
+            self._read_index()
+            records = []
+            for key in keys:
+                if key in self._index:
+                    record = self._record(key)
+                    if record is not None:
+                        records.append((key, record))
+
+            def write_data(tmp):
+                with open(tmp, 'wb') as f:
+                    for key, (payload, _) in records:
+                        f.write(key.encode('ascii') + payload)
+
+            def write_index(tmp):
+                offset = 0
+                with open(tmp, 'w') as f:
+                    for key, (payload, compressed) in records:
+                        length = KEY_SIZE + len(payload)
+                        f.write('%s %d %d %s\n' % (key, offset, length, 'z' if compressed else '-'))
+                        offset += length
+
+            dropped = len(self._index) - len(records)
+            atomic_write(self.path, write_data)
+            atomic_write(self.index_path, write_index)
+            self._reset()
+        log.info('Compacted %r: %d records dropped' % (self, dropped))
+        return dropped
+
+
+_stores = {}
+
+
+def get_body_store(location):
+    """ Returns shared `BodyStore` of the news table at `location` """
+    if location not in _stores:
+        _stores[location] = BodyStore(location)
+    return _stores[location]
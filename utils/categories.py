@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+
+from collections import OrderedDict
+
+from settings import CATEGORIES
+
+import logging
+log = logging.getLogger(__name__)
+
+
+class Error(Exception):
+    pass
+
+
+class CategoryError(Error):
+    pass
+
+
+class Category(object):
+    """ One entry of the `CATEGORIES` registry.
+
+    `button` is the msgid of the main menu button, `location` and
+    `archive_location` are the news table and the news archive.
+    """
+
+    def __init__(self, name, button, location, archive_location):
+        self.name = name
+        self.button = button
+        self.location = location
+        self.archive_location = archive_location
+
+    def __repr__(self):
+        return '<%s(%s)>' % (type(self).__name__, self.name)
+
+    @property
+    def state_name(self):
+        return '%sMenuState' % self.name
+
+
+categories = OrderedDict((category['name'], Category(**category)) for category in CATEGORIES)
+
+
+def get_category(name):
+    try:
+        return categories[name]
+    except KeyError:
+        raise CategoryError('unknown category: %(name)r' % vars())
+
+
+def category_names():
+    return list(categories)
@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+
+import time
+from collections import Counter
+
+import numpy as np
+from scipy.cluster.hierarchy import fcluster, linkage
+from sklearn.cluster import Birch, MiniBatchKMeans
+from sklearn.decomposition import TruncatedSVD
+from sklearn.preprocessing import normalize
+
+from settings import (
+    CLUSTER_ENGINE,
+    CLUSTER_SVD_COMPONENTS,
+    CLUSTER_BIRCH_THRESHOLD,
+    CLUSTER_MEAN_SIZE,
+    CLUSTER_ASSIGN_SIMILARITY,
+    CLUSTER_REBUILD_INTERVAL,
+)
+
+import logging
+log = logging.getLogger(__name__)
+
+
+class Error(Exception):
+    pass
+
+
+class ClusteringError(Error):
+    pass
+
+
+def fit_svd(X, components=CLUSTER_SVD_COMPONENTS):
+    k = min(components, X.shape[0] - 1, X.shape[1] - 1)
+    if k < 1:
+        return None
+    return TruncatedSVD(n_components=k, random_state=0).fit(X)
+
+
+def project(svd, X):
+    """ Projects sparse TF-IDF rows to dense unit vectors """
+    return normalize(X.toarray() if svd is None else svd.transform(X))
+
+
+def reduce(X, components=CLUSTER_SVD_COMPONENTS):
+    return project(fit_svd(X, components), X)
+
+
+class BaseClusterer(object):
+    """ Assigns contiguous 1-based cluster labels to rows of a TF-IDF matrix """
+
+    name = None
+
+    def fit_predict(self, X):
+        if X.shape[0] < 2:
+            return np.ones(X.shape[0], dtype=int)
+        labels = np.unique(self._fit_predict(X), return_inverse=True)[1]
+        return labels.reshape(-1) + 1
+
+    def _fit_predict(self, X):
+        raise NotImplementedError
+
+    def __repr__(self):
+        return '<%s>' % type(self).__name__
+
+
+class WardClusterer(BaseClusterer):
+    """ Exact Ward linkage. Densifies `X` and needs O(n^2) memory """
+
+    name = 'ward'
+
+    def __init__(self, threshold=1.4):
+        self.threshold = threshold
+
+    def _fit_predict(self, X):
+        Z = linkage(X.todense(), 'ward')
+        return fcluster(Z, self.threshold, criterion='distance')
+
+
+class BirchClusterer(BaseClusterer):
+    """ BIRCH over SVD-reduced vectors. Memory is bounded by the number
+    of subclusters, `threshold` plays the role of the Ward cut distance.
+    """
+
+    name = 'birch'
+
+    def __init__(self, threshold=CLUSTER_BIRCH_THRESHOLD, components=CLUSTER_SVD_COMPONENTS):
+        self.threshold = threshold
+        self.components = components
+
+    def _fit_predict(self, X):
+        birch = Birch(n_clusters=None, threshold=self.threshold)
+        return birch.fit_predict(reduce(X, self.components)) + 1
+
+
+class MiniBatchKMeansClusterer(BaseClusterer):
+    """ Mini-batch k-means over SVD-reduced vectors with roughly
+    `mean_size` articles per cluster.
+    """
+
+    name = 'minibatch'
+
+    def __init__(self, mean_size=CLUSTER_MEAN_SIZE, components=CLUSTER_SVD_COMPONENTS):
+        self.mean_size = mean_size
+        self.components = components
+
+    def _fit_predict(self, X):
+        n_clusters = max(1, X.shape[0] // self.mean_size)
+        kmeans = MiniBatchKMeans(n_clusters=n_clusters, random_state=0)
+        return kmeans.fit_predict(reduce(X, self.components)) + 1
+
+
+ENGINES = {
+    klass.name: klass
+    for klass in (WardClusterer, BirchClusterer, MiniBatchKMeansClusterer)
+}
+
+
+def get_clusterer(name=None):
+    name = name or CLUSTER_ENGINE
+    try:
+        return ENGINES[name]()
+    except KeyError:
+        raise ClusteringError('unknown clustering engine: %(name)r' % vars())
+
+
+def stable_labels(labels, previous, next_id):
+    """ Renames fresh `labels` to the `previous` ids of the same rows.
+
+    Every new cluster takes the old id it shares most rows with, each old
+    id is taken at most once, the rest get ids from `next_id` on.
+    Returns (labels, next_id).
+    """
+    overlap = Counter(
+        (new, old) for new, old in zip(labels, previous) if old > 0
+    )
+    mapping, taken = {}, set()
+    for (new, old), _ in overlap.most_common():
+        if new not in mapping and old not in taken:
+            mapping[new] = old
+            taken.add(old)
+    for new in np.unique(labels):
+        if new not in mapping:
+            mapping[new] = next_id
+            next_id += 1
+    return np.array([mapping[new] for new in labels], dtype=int), next_id
+
+
+class ClusterModel(object):
+    """ Cluster centroids kept between refreshes.
+
+    `build` clusters all articles from scratch, keeping the ids of the
+    clusters which survive, and stores the fitted projection with a
+    centroid per cluster. `assign` puts new articles into the nearest
+    cluster, or opens a new one when no centroid is similar enough, so
+    the cost of a refresh depends only on the number of new articles.
+
+    Both take TF-IDF rows of `vectors.IncrementalTfidf`; terms which
+    appeared after the last build are ignored until the next one.
+    """
+
+    def __init__(self, svd, n_features, ids, sums, next_id):
+        self.svd = svd
+        self.n_features = n_features
+        self.ids = list(ids)
+        self.sums = sums
+        self.next_id = next_id
+        self.built = time.time()
+
+    def __repr__(self):
+        return '<%s(clusters=%d, next_id=%d)>' % (type(self).__name__, len(self.ids), self.next_id)
+
+    def embed(self, X):
+        return project(self.svd, X[:, :self.n_features])
+
+    @property
+    def stale(self):
+        return time.time() - self.built > CLUSTER_REBUILD_INTERVAL
+
+    @classmethod
+    def build(cls, X, clusterer, previous=None, next_id=1):
+        """ Returns (model, labels) """
+        svd = fit_svd(X)
+        vectors = project(svd, X)
+
+        labels = clusterer.fit_predict(X)
+        if previous is None:
+            previous = np.zeros(len(labels), dtype=int)
+        if len(previous):
+            next_id = max(next_id, int(np.max(previous)) + 1)
+        labels, next_id = stable_labels(labels, previous, next_id)
+
+        ids = np.unique(labels)
+        sums = np.vstack([vectors[labels == c].sum(axis=0) for c in ids]) if len(ids) else None
+        return cls(svd, X.shape[1], ids, sums, next_id), labels
+
+    def assign(self, X):
+        labels = []
+        for vector in self.embed(X):
+            if self.ids:
+                similarities = normalize(self.sums).dot(vector)
+                best = int(np.argmax(similarities))
+                if similarities[best] >= CLUSTER_ASSIGN_SIMILARITY:
+                    self.sums[best] += vector
+                    labels.append(self.ids[best])
+                    continue
+            self.ids.append(self.next_id)
+            self.sums = vector[None, :] if self.sums is None else np.vstack([self.sums, vector])
+            labels.append(self.next_id)
+            self.next_id += 1
+        return np.array(labels, dtype=int)
+
+    def prune(self, alive):
+        """ Forgets clusters which have no articles left """
+        keep = [i for i, c in enumerate(self.ids) if c in alive]
+        self.ids = [self.ids[i] for i in keep]
+        self.sums = self.sums[keep] if keep else None
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+
+import time
+import zlib
+
+import numpy as np
+
+from settings import DEDUP_NUM_PERM, DEDUP_BANDS, DEDUP_THRESHOLD
+
+import logging
+log = logging.getLogger(__name__)
+
+
+PRIME = (1 << 31) - 1
+
+
+def shingles(text):
+    """ Returns hashes of lemmas and lemma pairs of `text` """
+    words = text.split()
+    grams = set(words)
+    grams.update(' '.join(pair) for pair in zip(words, words[1:]))
+    return np.array([zlib.crc32(gram.encode('utf-8')) for gram in grams], dtype=np.uint64)
+
+
+class MinHashLSH(object):
+    """ Near-duplicate detector over lemmatized headers and descriptions.
+
+    Every article gets a MinHash signature of `num_perm` values split
+    into `bands`; articles sharing any band are candidates, and the
+    candidate with the highest estimated Jaccard similarity above
+    `threshold` is the canonical one. Lookups only touch the matching
+    buckets. Links found to be duplicates are remembered so they are
+    not considered again.
+    """
+
+    def __init__(self, num_perm=DEDUP_NUM_PERM, bands=DEDUP_BANDS, threshold=DEDUP_THRESHOLD):
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.threshold = threshold
+        random = np.random.RandomState(1)
+        self._a = random.randint(1, PRIME, size=num_perm).astype(np.uint64)
+        self._b = random.randint(0, PRIME, size=num_perm).astype(np.uint64)
+        self.buckets = [{} for _ in range(bands)]
+        self.signatures = {}
+        self.duplicates = {}
+
+    def __repr__(self):
+        return '<%s(articles=%d, duplicates=%d)>' % (
+            type(self).__name__, len(self.signatures), len(self.duplicates),
+        )
+
+    def signature(self, text):
+        hashes = shingles(text)
+        if not len(hashes):
+            return None
+        return ((self._a[:, None] * hashes[None, :] + self._b[:, None]) % PRIME).min(axis=1)
+
+    def _keys(self, signature):
+        for band in range(self.bands):
+            yield band, signature[band * self.rows:(band + 1) * self.rows].tobytes()
+
+    def query(self, signature):
+        """ Returns link of the most similar known article or `None` """
+        candidates = set()
+        for band, key in self._keys(signature):
+            candidates.update(self.buckets[band].get(key, ()))
+        best, best_similarity = None, self.threshold
+        for link in candidates:
+            similarity = np.mean(self.signatures[link][0] == signature)
+            if similarity >= best_similarity:
+                best, best_similarity = link, similarity
+        return best
+
+    def insert(self, link, signature):
+        self.signatures[link] = (signature, time.time())
+        for band, key in self._keys(signature):
+            self.buckets[band].setdefault(key, set()).add(link)
+
+    def remove(self, link):
+        signature, _ = self.signatures.pop(link)
+        for band, key in self._keys(signature):
+            bucket = self.buckets[band].get(key)
+            bucket.discard(link)
+            if not bucket:
+                del self.buckets[band][key]
+
+    def prune(self, max_age):
+        """ Forgets articles and duplicates seen more than `max_age` seconds ago """
+        since = time.time() - max_age
+        for link in [link for link, (_, seen) in self.signatures.items() if seen < since]:
+            self.remove(link)
+        self.duplicates = {link: seen for link, seen in self.duplicates.items() if seen[1] >= since}
+
+    def canonical(self, link, text):
+        """ Returns canonical link if `link` duplicates a known article,
+        otherwise remembers the article and returns `None`.
+        """
+        signature = self.signature(text)
+        if signature is None:
+            return None
+        canonical = self.query(signature)
+        if canonical is None:
+            self.insert(link, signature)
+        else:
+            self.duplicates[link] = (canonical, time.time())
+        return canonical
@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.compat import urlparse
+from requests.adapters import HTTPAdapter
+
+from .storage import atomic_write
+
+from settings import RSS_FETCH_WORKERS, RSS_FETCH_TIMEOUT
+from settings import FEEDS, FEED_STATE_LOCATION, FEED_INTERVAL, FEED_MIN_INTERVAL, FEED_MAX_INTERVAL, FEED_TARGET_ITEMS
+
+import logging
+log = logging.getLogger(__name__)
+
+
+STREAM_CHUNK_SIZE = 16 * 1024
+SOURCE_PATTERN = re.compile('/([a-z.]+).(io|com|ru)')
+
+
+class Error(Exception):
+    pass
+
+
+class FeedError(Error):
+    pass
+
+
+class FeedUnchanged(Error):
+    pass
+
+
+class FeedFetcher(object):
+    """ Fetches RSS feeds concurrently over one keep-alive session.
+
+    Remembers ETag/Last-Modified of every feed and sends them back on
+    the next request, so feeds which did not change since the last
+    refresh are answered with `304 Not Modified` and skipped. Feeds
+    whose server ignores validators are skipped when the body hash
+    did not change.
+
+    Bodies are streamed in chunks, so parsing starts with the first
+    chunk and large feeds are never held in memory as a whole.
+    """
+
+    def __init__(self, workers=RSS_FETCH_WORKERS, timeout=RSS_FETCH_TIMEOUT):
+        self.workers = workers
+        self.timeout = timeout
+        self._validators = {}
+        self._digests = {}
+        self._lock = threading.Lock()
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def _headers(self, url):
+        with self._lock:
+            etag, modified = self._validators.get(url, (None, None))
+        headers = {}
+        if etag:
+            headers['If-None-Match'] = etag
+        if modified:
+            headers['If-Modified-Since'] = modified
+        return headers
+
+    def _remember(self, url, response, digest):
+        """ Returns `False` if the body is the same as the last time """
+        validators = (
+            response.headers.get('ETag'),
+            response.headers.get('Last-Modified'),
+        )
+        with self._lock:
+            if any(validators):
+                self._validators[url] = validators
+            else:
+                self._validators.pop(url, None)
+            changed = self._digests.get(url) != digest
+            self._digests[url] = digest
+        return changed
+
+    def _open(self, url):
+        """ Returns streamed response or `None` if the feed is not
+        modified or failed.
+        """
+        try:
+            response = self.session.get(
+                url,
+                headers=self._headers(url),
+                timeout=self.timeout,
+                stream=True,
+            )
+        except requests.exceptions.RequestException as err:
+            log.warning('Failed to fetch %(url)s: %(err)s' % vars())
+            return None
+
+        if response.status_code == 304:
+            log.info('Feed %(url)s is not modified' % vars())
+            response.close()
+            return None
+
+        if response.status_code != 200:
+            log.warning('Feed %s answered %d' % (url, response.status_code))
+            response.close()
+            return None
+        return response
+
+    def stream(self, url):
+        """ Yields chunks of the feed body as they arrive.
+
+        Yields nothing if the feed is not modified or failed. Raises
+        `FeedUnchanged` after the last chunk if the body is the same as
+        the last time and `FeedError` if the transfer breaks.
+        """
+        response = self._open(url)
+        if response is None:
+            return
+        digest = hashlib.md5()
+        try:
+            for chunk in response.iter_content(STREAM_CHUNK_SIZE):
+                digest.update(chunk)
+                yield chunk
+        except requests.exceptions.RequestException as err:
+            raise FeedError('Failed to fetch %(url)s: %(err)s' % vars())
+        finally:
+            response.close()
+
+        if not self._remember(url, response, digest.hexdigest()):
+            raise FeedUnchanged('Feed %(url)s did not change' % vars())
+
+    def fetch(self, url):
+        """ Returns feed body or `None` if the feed is unchanged or failed """
+        try:
+            return b''.join(self.stream(url)) or None
+        except Error as err:
+            log.info(err)
+            return None
+
+    def fetch_all(self, urls, handler):
+        """ Fetches `urls` concurrently and applies `handler(url, chunks)`
+        to the streamed body of every feed. Returns dict url -> handler
+        result, `None` for feeds which failed or did not change.
+        """
+        def job(url):
+            try:
+                return url, handler(url, self.stream(url))
+            except Error as err:
+                log.info(err)
+                return url, None
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            return dict(pool.map(job, urls))
+
+
+fetcher = FeedFetcher()
+
+
+def feed_source(url):
+    """ Returns source name of feed `url`, e.g. `Lenta` for
+    `https://lenta.ru/rss`, or None if the url has no host
+    """
+    match = SOURCE_PATTERN.findall(url)
+    if match:
+        return match[0][0].split('.')[-1].capitalize()
+    labels = [label for label in urlparse(url).netloc.split(':')[0].split('.') if label and label != 'www']
+    if not labels:
+        return None
+    return labels[-2 if len(labels) > 1 else -1].capitalize()
+
+
+class Feed(object):
+    """ One entry of the `FEEDS` registry.
+
+    `weight` scales the feed source in cluster source diversity and
+    `interval` is the polling interval to start from. `source` defaults
+    to the name derived from the url.
+    """
+
+    def __init__(self, url, category, weight=1.0, interval=FEED_INTERVAL, source=None):
+        self.url = url
+        self.category = category
+        self.weight = weight
+        self.interval = interval
+        self.source = source or feed_source(url)
+
+    def __repr__(self):
+        return '<%s(%s, %s)>' % (type(self).__name__, self.category, self.url)
+
+
+def load_feeds(feeds=None):
+    return [Feed(**feed) for feed in (FEEDS if feeds is None else feeds)]
+
+
+class FeedScheduler(object):
+    """ Polls every feed as often as it publishes.
+
+    After each poll the new-item rate of the feed is smoothed and its
+    interval set so that a poll finds about `FEED_TARGET_ITEMS` new
+    items, within `FEED_MIN_INTERVAL` and `FEED_MAX_INTERVAL`. A poll
+    without new items (including unchanged and failed ones) doubles the
+    interval. The state is kept in a JSON file between runs.
+    """
+
+    smoothing = 0.5
+
+    def __init__(self, feeds, state_location=FEED_STATE_LOCATION):
+        self.feeds = feeds
+        self.state_location = state_location
+        state = {}
+        if os.path.exists(state_location):
+            with open(state_location) as f:
+                state = json.load(f)
+        self.state = {
+            feed.url: state.get(feed.url, dict(interval=feed.interval, next_poll=0, rate=None, links=[]))
+            for feed in feeds
+        }
+
+    def save(self):
+        def write(tmp):
+            with open(tmp, 'w') as f:
+                json.dump(self.state, f, indent=2, sort_keys=True)
+        atomic_write(self.state_location, write)
+
+    def due(self, now=None):
+        now = now or time.time()
+        return [feed for feed in self.feeds if self.state[feed.url]['next_poll'] <= now]
+
+    def update(self, feed, links, now=None):
+        """ Records a poll of `feed` which returned item `links`, `None`
+        if the feed did not change or failed. Returns the new interval.
+        """
+        now = now or time.time()
+        state = self.state[feed.url]
+        known = set(state['links'])
+        new = len(set(links) - known) if links else 0
+        elapsed = now - state.get('polled', now - state['interval'])
+
+        if links and known and new:
+            rate = new / max(elapsed, 1.)
+            if state['rate'] is not None:
+                rate = self.smoothing * rate + (1 - self.smoothing) * state['rate']
+            state['rate'] = rate
+            interval = FEED_TARGET_ITEMS / rate
+        elif known:
+            interval = state['interval'] * 2
+        else:
+            interval = state['interval']
+        interval = min(max(interval, FEED_MIN_INTERVAL), FEED_MAX_INTERVAL)
+
+        if links:
+            state['links'] = list(links)
+        state.update(interval=interval, polled=now, next_poll=now + interval)
+        log.info('Feed %s: %d new items, next poll in %ds' % (feed.url, new, interval))
+        return interval
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from string import punctuation
+
+import pymorphy2
+
+from settings import LEMMA_CACHE_SIZE, LEMMATIZE_WORKERS, LEMMATIZE_CHUNKSIZE
+
+import logging
+log = logging.getLogger(__name__)
+
+
+exclude = "[" + punctuation + "'0123456789[]—«»–]"
+exclude_table = str.maketrans('', '', exclude)
+grammemes = ('NOUN', 'VERB', 'ADJF')
+
+_analyzer = None
+_analyzer_lock = threading.Lock()
+
+
+def get_analyzer():
+    """ Returns process-wide `pymorphy2.MorphAnalyzer` """
+    global _analyzer
+    if _analyzer is None:
+        with _analyzer_lock:
+            if _analyzer is None:
+                _analyzer = pymorphy2.MorphAnalyzer()
+    return _analyzer
+
+
+class LemmaCache(object):
+    """ Bounded LRU cache: token -> (normal form, part of speech) """
+
+    def __init__(self, maxsize=LEMMA_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, word):
+        with self._lock:
+            try:
+                value = self._data[word]
+            except KeyError:
+                self.misses += 1
+                return None
+            self._data.move_to_end(word)
+            self.hits += 1
+            return value
+
+    def set(self, word, value):
+        with self._lock:
+            self._data[word] = value
+            self._data.move_to_end(word)
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = 0
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def __len__(self):
+        return len(self._data)
+
+    def __repr__(self):
+        return '<%s(size=%d, hits=%d, misses=%d, hit_rate=%.2f)>' % (
+            type(self).__name__, len(self), self.hits, self.misses, self.hit_rate,
+        )
+
+
+lemma_cache = LemmaCache()
+
+
+def lemmatize(word):
+    """ Returns (normal form, part of speech) of `word` """
+    value = lemma_cache.get(word)
+    if value is None:
+        gram_info = get_analyzer().parse(word)[0]
+        value = (gram_info.normal_form, gram_info.tag.POS)
+        lemma_cache.set(word, value)
+    return value
+
+
+def normal_form(text):
+    text = re.sub(r'([^\s\w])', '', text)
+    nouns = []
+
+    for word in text.split():
+        if word.translate(exclude_table) != '':
+            lemma, pos = lemmatize(word)
+            if pos in grammemes:
+                nouns.append(lemma)
+    return ' '.join(nouns)
+
+
+def normalize_texts(texts, workers=None, chunksize=LEMMATIZE_CHUNKSIZE):
+    """ Applies `normal_form` to a batch of texts on a process pool.
+
+    Every worker keeps its own analyzer and lemma cache. `workers`
+    defaults to `LEMMATIZE_WORKERS`; with less than two workers (or a
+    tiny batch) texts are normalized in-process.
+    """
+    if workers is None:
+        workers = LEMMATIZE_WORKERS
+    texts = ['' if text is None else str(text) for text in texts]
+    if workers < 2 or len(texts) <= chunksize:
+        return [normal_form(text) for text in texts]
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(normal_form, texts, chunksize=chunksize))
@@ -1,36 +1,26 @@
 # -*- coding: utf-8 -*-
 
-from bs4 import BeautifulSoup
-from datetime import timedelta, datetime
-from nltk import FreqDist
-import pymorphy2
-from random import choice, sample
-from string import punctuation
-import requests
-import pandas as pd
-from sklearn.feature_extraction.text import TfidfVectorizer
-import numpy as np
 from random import choice
-from scipy.cluster.hierarchy import fcluster, linkage
-from newspaper import Article
-import re
+import numpy as np
 import logging
+import uuid
+from redis.exceptions import RedisError
+from cache import Context, DigestCache, SnapshotVersions, SnapshotFrames, SearchRequests
 from .botan import *
 from .decorators import async
+from .storage import load_news
+from .snapshot import SnapshotRegistry, EXCERPT_WORDS, EXCERPT_POSITION, dump_frame, load_frame
+from .i18n import langs
+from .categories import get_category, category_names
 
 
 log = logging.getLogger(__name__)
 
 
-from settings import KREMLIN_NEWS_LOCATION, ALL_KREMLIN_NEWS_LOCATION, MEGAFON_NEWS_LOCATION, ALL_MEGAFON_NEWS_LOCATION
-
+from settings import DEFAULT_LANGUAGE, DIGEST_TIMEOUT, SEEN_SAMPLES, SEEN_TIMEOUT, INLINE_RESULTS
+from settings import SNAPSHOT_TIMEOUT, SEARCH_TIMEOUT
 
 
-exclude = "[" + punctuation + "'0123456789[]—«»–]"
-alt_normal_forms = {"газа":"газ", "Песков":"песков"}
-cands = ['NOUN']
-stopwords = ['россия', 'сша']
-
 
 def represent_news(text):
     words = text.split()
@@ -43,137 +33,57 @@ def represent_news(text):
     return news_start, news_other
 
 
-def normal_form(text):
-    text = re.sub(r'([^\s\w])', '', text)
-    news_text = text.split()
-    nouns = []
-
-    morph = pymorphy2.MorphAnalyzer()
-
-    for word in news_text:
-        word_cleaned = ''.join(ch for ch in word if ch not in exclude)
-        if word_cleaned != '':
-            gram_info = morph.parse(word)[0]
-            if 'NOUN' in gram_info.tag or 'VERB' in gram_info.tag or 'ADJF' in gram_info.tag:
-                try:
-                    nouns.append(morph.parse(word)[0].normal_form)
-                except:
-                    pass
-    return ' '.join(nouns)
-
-
-def clean_text(text):
-    return text.replace('&quot', '').replace('\n', '').replace('\xa0',' ')
-
-
-def parse_rss(rss_url):
-    new = []
-
-    raw_html = requests.get(rss_url).text
-    soup = BeautifulSoup(raw_html, 'html.parser')
-    news = soup.find_all('item')
-    for item in news:
-        try:
-            news_title = clean_text(item.title.getText())
-            news_description = ''
-            if item.description is not None:
-                news_description = clean_text(item.description.getText())
-            news_pubdate = ''.join(item.pubdate.getText()[:-6].split(',')[1:]).strip()
-            news_link = item.link.getText()
-            news_source = re.findall('/([a-z.]+).(io|com|ru)', rss_url)[0][0].split('.')[-1].capitalize()
-            new.append([news_title, normal_form(news_title), news_link,
-                     news_description, normal_form(news_description), news_pubdate, news_source])
-        except:
-            pass
-    return new
-
-
-def _upb_news(category, medias):
-    if category == 'Kremlin':
-        NEWS_LOCATION = KREMLIN_NEWS_LOCATION
-        ALL_NEWS_LOCATION = ALL_KREMLIN_NEWS_LOCATION
-    else:
-        NEWS_LOCATION = MEGAFON_NEWS_LOCATION
-        ALL_NEWS_LOCATION = ALL_MEGAFON_NEWS_LOCATION
+def _load_news(category):
+    return load_news(get_category(category).location)
 
-    try:
-        news_file = pd.read_csv(NEWS_LOCATION, header=0)
-    except:
-        news_file = pd.DataFrame(columns=['header', 'header_preproc', 'link', 'text', 'text_preproc', 'date', 'source',
-            'full_text', 'full_text_preproc'])
-
-
-    counter = 0
-    for c, news in enumerate(medias):
-        if not news[2] in news_file['link'].values:
-            if datetime.now() - datetime.strptime(news[5], "%d %b %Y %H:%M:%S") < timedelta(days=1):
-                article = Article(news[2], language='ru')
-                article.download()
-                try:
-                    article.parse()
-                except:
-                    pass
-                news.append(article.text)
-                news.append(normal_form(article.text))
-                if (('cluster' in news_file.columns) & ('hot_topic' in news_file.columns)):
-                    news += [0,0]
-                news_file.loc[len(news_file)]=news
-                counter += 1
-
-    news_file.drop_duplicates('link', inplace = True)
-    news_file['date'] = news_file['date'].astype('str')
-    news_file = news_file[[len(date) > 7 for date in news_file['date'].values]]
-    news_file['date'] = pd.to_datetime(news_file['date'])
-    news_file['date'] = pd.to_datetime(news_file['date'])
-    news_file = news_file[news_file['date'] > datetime.now() - timedelta(days=1)]
-
-    news_file.to_csv(NEWS_LOCATION, index=False)
-    print('Added %d news' % counter)
 
+def _published_version(category):
     try:
-        all_time_news_file = pd.read_csv(ALL_NEWS_LOCATION, header=0)
-    except:
-        all_time_news_file = pd.DataFrame(columns=['header', 'header_preproc', 'link', 'text', 'text_preproc', 'date', 'source',
-            'full_text', 'full_text_preproc'])
-    all_time_news_file = all_time_news_file.append(news_file)
-    all_time_news_file.drop_duplicates('link', inplace=True)
-    all_time_news_file['date'] = pd.to_datetime(all_time_news_file['date'])
-    all_time_news_file.to_csv(ALL_NEWS_LOCATION, index=False)
+        return versions.get(category)
+    except RedisError as err:
+        log.warning('Failed to get snapshot version: %s' % err)
+        return None
 
 
+def _published_frame(category, version):
+    """ Returns the frame of a published snapshot or `None` if it
+    expired already
+    """
+    try:
+        payload = frames.get(category, version)
+    except RedisError as err:
+        log.warning('Failed to get snapshot frame: %s' % err)
+        return None
+    return load_frame(payload) if payload is not None else None
 
-def upd_news():
-    log.info('____________ updating news _________________')
 
-    meduza_news = parse_rss('https://meduza.io/rss/news')
-    interfax_news = parse_rss('http://interfax.ru/rss.asp')
-    lenta_news = parse_rss('https://lenta.ru/rss')
-    tass_news = parse_rss('http://tass.ru/rss/v2.xml')
-    rambler_news = parse_rss('https://news.rambler.ru/rss/head/')
-    russia_today_news = parse_rss('https://russian.rt.com/rss')
-    vedomosti_news = parse_rss('https://vedomosti.ru/rss/news')
-    radio_svoboda_news = parse_rss('https://www.svoboda.org/api/z-pqpiev-qpp')
-    kommersant_news = parse_rss('https://www.kommersant.ru/RSS/news.xml')
-    republic_news = parse_rss('https://republic.ru/export/news.xml')
-    raintv_news = parse_rss('https://tvrain.ru/export/rss/programs/1018.xml')
+def _load_snapshot(category):
+    """ Returns the last published snapshot, or the news table if
+    nothing has been published yet.
+    """
+    version = _published_version(category)
+    if version is not None:
+        frame = _published_frame(category, version)
+        if frame is not None:
+            return frame, version
+    return _load_news(category), None
 
-    kremlin_news = interfax_news + lenta_news + tass_news + rambler_news + russia_today_news
-    megafon_news = meduza_news + vedomosti_news + radio_svoboda_news + kommersant_news + republic_news + raintv_news
 
+snapshots = SnapshotRegistry(_load_snapshot)
+versions = SnapshotVersions()
+frames = SnapshotFrames()
 
-    _upb_news('Kremlin', kremlin_news)
-    _upb_news('Megafon', megafon_news)
 
-    log.info('============= UPDATED NEWS ================')
+digests = DigestCache()
 
+DIGEST_PAGES = {
+    'hot': lambda snapshot: snapshot.hot,
+    'more': lambda snapshot: snapshot.other_hot,
+}
 
-def get_hot_news(category='Kremlin'):
-    if category == 'Kremlin':
-        NEWS_LOCATION = KREMLIN_NEWS_LOCATION
-    else:
-        NEWS_LOCATION = MEGAFON_NEWS_LOCATION
-    df = pd.read_csv(NEWS_LOCATION, header=0)
-    hot = df[df['hot_topic'] > 3].sort_values('hot_topic', ascending=False).values
+
+def render_digest(df):
+    hot = df.values
     news = []
     for c in range(len(hot)):
         news_start, news_other = represent_news(hot[c][0])
@@ -181,128 +91,160 @@ def get_hot_news(category='Kremlin'):
     return '\n\n'.join(news)
 
 
-def get_other_hot_news(category='Kremlin'):
-    if category == 'Kremlin':
-        NEWS_LOCATION = KREMLIN_NEWS_LOCATION
-    else:
-        NEWS_LOCATION = MEGAFON_NEWS_LOCATION
-    df = pd.read_csv(NEWS_LOCATION, header=0)
-    hot = df[(df['hot_topic'] < 4) & (df['hot_topic'] > 0)].sort_values('hot_topic', ascending=False).values
-    news = []
-    for c in range(len(hot)):
-        news_start, news_other = represent_news(hot[c][0])
-        news.append('▶ <a href="%s">%s</a> %s' % (hot[c][2], news_start, news_other))
-    return '\n\n'.join(news)
+def render_digests(snapshot):
+    """ Stores digest pages of `snapshot` """
+    try:
+        for page, view in DIGEST_PAGES.items():
+            digests.set(snapshot.category, snapshot.version, page, render_digest(view(snapshot)), timeout=DIGEST_TIMEOUT)
+    except RedisError as err:
+        log.warning('Failed to store digests of %r: %s' % (snapshot, err))
 
 
-def update_clusters(category='Kremlin'):
-    if category == 'Kremlin':
-        NEWS_LOCATION = KREMLIN_NEWS_LOCATION
-    else:
-        NEWS_LOCATION = MEGAFON_NEWS_LOCATION
-    df = pd.read_csv(NEWS_LOCATION)
-    df = df.fillna('')
-    df['date'] = pd.to_datetime(df['date'])
-    headers = df['header'].values
-    norm_texts = (df['header_preproc'] + df['text_preproc'] + df['full_text_preproc']).values
-
-    for c in range(len(norm_texts)):
-        norm_texts[c] = norm_texts[c].replace('\xa0', ' ')
-    tf = TfidfVectorizer()
-    texts_transformed = tf.fit_transform(norm_texts)
-
-    Z = linkage(texts_transformed.todense(), 'ward')
-    clusters = fcluster(Z, 1.4, criterion='distance')
-    for c in np.unique(clusters):
-        df.loc[clusters == c, 'cluster'] = c
-    df.to_csv(NEWS_LOCATION, index=False)
-    log.info('Clusters updated')
-
-
-def set_hot_news(category='Kremlin'):
-    if category == 'Kremlin':
-        NEWS_LOCATION = KREMLIN_NEWS_LOCATION
-    else:
-        NEWS_LOCATION = MEGAFON_NEWS_LOCATION
-    df = pd.read_csv(NEWS_LOCATION)
-    df['date'] = pd.to_datetime(df['date'])
-    df['hot_topic'] = 0
-    cluster_sizes = df.groupby('cluster').count()['header'].values
-    avg_time = []
-    sources = []
-    for c in np.unique(df['cluster']):
-        avg_time.append((datetime.now() - df[df['cluster'] == c]['date']).astype('m8[ms]').mean())
-        sources.append(np.unique(df[df['cluster'] == c]['source'].values).shape[0])
-    time_ind = np.array(avg_time)/max(avg_time)
-    news_rate = np.array(cluster_sizes) * np.array((3-time_ind))*(1+np.array(sources)/7)
-    clust_rating = np.argsort(news_rate)[::-1] + 1
-    for i, cluster in enumerate((clust_rating[:10])):
-        df.set_value(df[df['header'] == (get_cl(df[df['cluster'] == cluster]['header'].values))].index.values[0], 'hot_topic', 10-i)
-    df.to_csv(NEWS_LOCATION, index=False)
-    log.info('Hot news updated')
-
-
-def get_cl(cluster):
-    distances = np.zeros(shape=(len(cluster), len(cluster)))
-    for c in range(len(cluster)):
-        for d in range(len(cluster)):
-            distances[c][d] = distance(cluster[c], cluster[d])
-    a = distances.sum(axis=1)
-    return cluster[np.argmin(a)]
-
-
-def distance(a, b):
-    "Calculates the Levenshtein distance between a and b."
-    n, m = len(a), len(b)
-    if n > m:
-        a, b = b, a
-        n, m = m, n
-
-    current_row = range(n+1)
-    for i in range(1, m+1):
-        previous_row, current_row = current_row, [i]+[0]*n
-        for j in range(1,n+1):
-            add, delete, change = previous_row[j]+1, current_row[j-1]+1, previous_row[j-1]
-            if a[j-1] != b[i-1]:
-                change += 1
-            current_row[j] = min(add, delete, change)
-
-    return current_row[n]
-
-
-def get_random_news(category='Kremlin'):
-    if category == 'Kremlin':
-        NEWS_LOCATION = KREMLIN_NEWS_LOCATION
-    else:
-        NEWS_LOCATION = MEGAFON_NEWS_LOCATION
-    news_file = pd.read_csv(NEWS_LOCATION, header=0)
-    news_file['date'] = pd.to_datetime(news_file['date'])
-    news_file = news_file.sort_values('date', ascending=False).head(30)
-    rand_news = news_file.sample().values[0]
+def get_digest(category, page):
+    snapshot = snapshots.get(category)
+    try:
+        text = digests.get(category, snapshot.version, page)
+    except RedisError as err:
+        log.warning('Failed to get digest: %s' % err)
+        text = None
+    if text is None:
+        text = render_digest(DIGEST_PAGES[page](snapshot))
+    return text
+
+
+def publish_snapshot(category='Kremlin'):
+    """ Publishes the current news table as a new snapshot version for
+    this process, digests and every bot process polling `versions`.
+
+    Frames go through Redis, so bot processes need no file system
+    shared with the worker. A replaced frame and its digests stay
+    loadable for `SNAPSHOT_TIMEOUT` for bots which saw its version just
+    before.
+    """
+    snapshot = snapshots.publish(category, _load_news(category))
+    render_digests(snapshot)
+    try:
+        previous = versions.get(category)
+        frames.set(category, snapshot.version, dump_frame(snapshot.frame))
+        versions.set(category, snapshot.version)
+        if previous is not None and previous != snapshot.version:
+            frames.expire(category, previous, SNAPSHOT_TIMEOUT)
+            for page in DIGEST_PAGES:
+                digests.expire(category, previous, page, SNAPSHOT_TIMEOUT)
+    except RedisError as err:
+        log.warning('Failed to publish %r: %s' % (snapshot, err))
+    return snapshot
+
+
+def refresh_snapshots(bot=None, job=None):
+    """ Picks up snapshots published by the refresh worker """
+    for category in category_names():
+        version = _published_version(category)
+        if version is None or version == snapshots.version(category):
+            continue
+        frame = _published_frame(category, version)
+        if frame is not None:
+            snapshots.publish(category, frame, version)
+
+
+def snapshot_version(category='Kremlin'):
+    return snapshots.version(category)
+
+
+def get_hot_news(category='Kremlin'):
+    return get_digest(category, 'hot')
+
+
+def get_other_hot_news(category='Kremlin'):
+    return get_digest(category, 'more')
+
+
+def _pick_unseen(chat_id, snapshot, pick, positions):
+    """ Returns a frame position of `snapshot` from `pick()` which was
+    not sent to `chat_id` yet and marks it as seen.
+
+    Seen news are kept by link hash, so they stay seen across snapshot
+    versions. A few random picks are checked with one round trip; only
+    if all of them were seen the `positions` of the whole pool are
+    checked, and once the chat saw the whole pool it starts over.
+    """
+    position = pick()
+    if chat_id is None:
+        return position
+    ctx = Context(chat_id)
+    category = snapshot.category
+    try:
+        candidates = [position] + [pick() for _ in range(SEEN_SAMPLES - 1)]
+        seen = ctx.get_seen(category, snapshot.hashes[candidates])
+        unseen = [c for c, is_seen in zip(candidates, seen) if not is_seen]
+        if unseen:
+            position = unseen[0]
+        else:
+            positions = np.asarray(positions)
+            seen = np.array(ctx.get_seen(category, snapshot.hashes[positions]), dtype=bool)
+            if seen.all():
+                ctx.reset_seen(category, snapshot.hashes[positions])
+            else:
+                position = choice(positions[~seen])
+        ctx.p_set_seen(category, snapshot.hashes[position], timeout=SEEN_TIMEOUT)
+        ctx.apply()
+    except RedisError as err:
+        log.warning('Failed to track news seen by %s: %s' % (chat_id, err))
+    return position
+
+
+def render_news(rand_news):
     news_start, news_other = represent_news(rand_news[0])
-    news_words = rand_news[7].split()
-    full_text = '    ' + ' '.join(news_words[:100])
-    if len(news_words) > 100:
+    news_words = rand_news[EXCERPT_POSITION].split()
+    full_text = '    ' + ' '.join(news_words[:EXCERPT_WORDS])
+    if len(news_words) > EXCERPT_WORDS:
         full_text += '... <a href="%s">Читать далее</a>' % (rand_news[2])
     return '🆕 %s, %s: <a href="%s">%s</a> %s \n\n%s' % (rand_news[5].strftime('%Y-%m-%d %H:%M'), rand_news[6],
         rand_news[2], news_start, news_other,  full_text)
 
 
-def get_rare(chat_id=None, category='Kremlin'):
-    if category == 'Kremlin':
-        NEWS_LOCATION = KREMLIN_NEWS_LOCATION
-    else:
-        NEWS_LOCATION = MEGAFON_NEWS_LOCATION
+def get_random_news(category='Kremlin', chat_id=None):
+    snapshot = snapshots.get(category)
+    latest = snapshot.latest.index.values
+    position = _pick_unseen(chat_id, snapshot, lambda: choice(latest), latest)
+    return render_news(snapshot.frame.iloc[position].values)
 
-    df = pd.read_csv(NEWS_LOCATION, header=0)
-    df = df.fillna('')
-    df = df[~df['text'].str.contains('Порошенко|Украин|Трамп')]
-    df['date'] = pd.to_datetime(df['date'])
-    rand_news =  df[df['cluster'] == choice(np.argsort(np.unique(df['cluster'].values, return_counts=True)[1])[:10])].sample().values[0]
-    news_start, news_other = represent_news(rand_news[0])
-    news_words = rand_news[7].split()
-    full_text = '    ' + ' '.join(news_words[:100])
-    if len(news_words) > 100:
-        full_text += '... <a href="%s">Читать далее</a>' % (rand_news[2])
-    return '🆕 %s, %s: <a href="%s">%s</a> %s \n\n%s' % (rand_news[5].strftime('%Y-%m-%d %H:%M'), rand_news[6],
-        rand_news[2], news_start, news_other,  full_text)
\ No newline at end of file
+
+def get_rare(chat_id=None, category='Kremlin'):
+    snapshot = snapshots.get(category)
+    if not snapshot.rare:
+        return get_random_news(category, chat_id=chat_id)
+    pick = lambda: choice(choice(snapshot.rare))
+    position = _pick_unseen(chat_id, snapshot, pick, snapshot.rare_positions)
+    return render_news(snapshot.frame.iloc[position].values)
+
+def suggest_headlines(query, limit=INLINE_RESULTS, categories=None):
+    """ Returns up to `limit` (category, row, text) of current news whose
+    headers match the typed `query`, from every category in turn. `text`
+    is the rendered news, memoized by the snapshot with the matches.
+    """
+    suggestions = []
+    for category in categories or category_names():
+        suggestions.extend(
+            (category, news, text) for news, text in snapshots.get(category).headlines.suggest(query, limit, render=render_news)
+        )
+    return suggestions[:limit]
+
+
+searches = SearchRequests()
+
+
+def search_archive(text, lang=DEFAULT_LANGUAGE, timeout=SEARCH_TIMEOUT):
+    """ Returns the answer of the refresh worker, which holds the search
+    index, to the /search `text`
+    """
+    request_id = uuid.uuid4().hex
+    try:
+        searches.push(request_id, (text, lang), timeout)
+        answer = searches.wait(request_id, timeout)
+    except RedisError as err:
+        log.warning('Failed to search: %s' % err)
+        answer = None
+    if answer is None:
+        return langs[lang].gettext('SEARCH_UNAVAILABLE_TEXT')
+    return answer
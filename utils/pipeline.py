@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+
+from .refresh import (
+    fetch_news,
+    ingest_news,
+    normalize_news,
+    vectorize_news,
+    update_clusters,
+    set_hot_news,
+)
+from .news import publish_snapshot
+from .search import serve_search
+from .storage import atomic_write
+from .categories import category_names
+
+from settings import PIPELINE_STATE_LOCATION, REFRESH_INTERVAL
+
+import logging
+log = logging.getLogger(__name__)
+
+
+class Error(Exception):
+    pass
+
+
+class PipelineError(Error):
+    pass
+
+
+class Stage(object):
+    """ One step of the refresh pipeline.
+
+    `func(*args)` returns `False` when it produced nothing new, anything
+    else counts as a change. A stage is skipped when none of the stages
+    it depends on changed since it last ran, unless it is `always` run.
+    Stages of a `group` run one after another in the worker process of
+    that group; stages without a group run in the calling process.
+    """
+
+    def __init__(self, name, func, args=(), deps=(), always=False, group=None):
+        self.name = name
+        self.func = func
+        self.args = tuple(args)
+        self.deps = list(deps)
+        self.always = always
+        self.group = group
+
+    def __repr__(self):
+        return '<%s(%s)>' % (type(self).__name__, self.name)
+
+    def __call__(self):
+        return self.func(*self.args)
+
+
+_executors = {}
+
+
+def get_executor(group):
+    """ Returns the single-process executor of `group`.
+
+    Executors outlive pipeline runs, so a group keeps its caches warm
+    and only ever one process touches the files of a group.
+    """
+    if group not in _executors:
+        _executors[group] = ProcessPoolExecutor(max_workers=1)
+    return _executors[group]
+
+
+def discard_executor(group):
+    """ Drops the executor of `group` whose process died, the next
+    `get_executor` starts a new one.
+    """
+    executor = _executors.pop(group, None)
+    if executor is not None:
+        log.warning('Worker process of %s died, restarting it' % group)
+        executor.shutdown(wait=False)
+
+
+class Pipeline(object):
+    """ Runs stages as soon as their dependencies are done and persists
+    progress after every stage.
+
+    The state file keeps, for every stage, the tokens of its inputs,
+    its own output token and timings. If a run dies half way, the next
+    `run` resumes it from the unfinished stages instead of starting
+    over; if the resumed run fails too, the one after starts over. A
+    failed stage only stops the stages depending on it. Stages of
+    different groups run in parallel.
+    """
+
+    def __init__(self, stages, state_location=PIPELINE_STATE_LOCATION):
+        self.stages = stages
+        self.state_location = state_location
+
+    def load_state(self):
+        if not os.path.exists(self.state_location):
+            return dict(run=None, finished=True, stages={})
+        with open(self.state_location) as f:
+            return json.load(f)
+
+    def save_state(self, state):
+        def write(tmp):
+            with open(tmp, 'w') as f:
+                json.dump(state, f, indent=2, sort_keys=True)
+        atomic_write(self.state_location, write)
+
+    def _finish(self, state, stage, inputs, changed, elapsed):
+        info = state['stages'][stage.name]
+        if changed is not False or info['token'] is None:
+            info['token'] = uuid.uuid4().hex
+        info.update(done=True, skipped=False, inputs=inputs, time=elapsed)
+        self.save_state(state)
+        log.info('Stage %s done in %.2fs%s' % (
+            stage.name, elapsed, '' if changed is not False else ', nothing new'))
+
+    def run(self):
+        state = self.load_state()
+        if not state['finished'] and state.get('resumed'):
+            log.warning('Resumed pipeline run %s failed, starting over' % state['run'])
+        if state['finished'] or state.get('resumed'):
+            state.update(run=uuid.uuid4().hex, started=time.time(), finished=False, resumed=False)
+            for stage in state['stages'].values():
+                stage['done'] = False
+        else:
+            log.info('Resuming pipeline run %s' % state['run'])
+            state['resumed'] = True
+        self.save_state(state)
+
+        pending = []
+        for stage in self.stages:
+            info = state['stages'].setdefault(stage.name, dict(done=False, token=None, inputs=None))
+            if not info['done']:
+                pending.append(stage)
+
+        running, failed = {}, []
+        while pending or running:
+            for stage in [stage for stage in pending if all(state['stages'][dep]['done'] for dep in stage.deps)]:
+                pending.remove(stage)
+                info = state['stages'][stage.name]
+                inputs = [state['stages'][dep]['token'] for dep in stage.deps]
+                if not stage.always and info['inputs'] == inputs and info['token'] is not None:
+                    log.info('Stage %s skipped: inputs did not change' % stage.name)
+                    info.update(done=True, skipped=True, time=0.0)
+                    self.save_state(state)
+                elif stage.group is None:
+                    start = time.time()
+                    changed = stage()
+                    self._finish(state, stage, inputs, changed, time.time() - start)
+                else:
+                    try:
+                        future = get_executor(stage.group).submit(stage)
+                    except BrokenProcessPool:
+                        discard_executor(stage.group)
+                        future = get_executor(stage.group).submit(stage)
+                    running[future] = (stage, inputs, time.time())
+
+            if not running:
+                if pending and not any(all(state['stages'][dep]['done'] for dep in stage.deps) for stage in pending):
+                    raise PipelineError('unsatisfiable dependencies: %r' % pending)
+                continue
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage, inputs, start = running.pop(future)
+                try:
+                    changed = future.result()
+                except BrokenProcessPool:
+                    log.exception('Stage %s failed' % stage.name)
+                    discard_executor(stage.group)
+                    failed.append(stage.name)
+                    continue
+                except Exception:
+                    log.exception('Stage %s failed' % stage.name)
+                    failed.append(stage.name)
+                    continue
+                self._finish(state, stage, inputs, changed, time.time() - start)
+            # let running stages finish, but start nothing depending on failed ones
+            blocked = set(failed)
+            while True:
+                dropped = [stage for stage in pending if blocked.intersection(stage.deps)]
+                if not dropped:
+                    break
+                for stage in dropped:
+                    pending.remove(stage)
+                    blocked.add(stage.name)
+
+        if failed:
+            raise PipelineError('failed stages: %s' % ', '.join(failed))
+        state.update(finished=True, time=time.time() - state['started'])
+        self.save_state(state)
+        log.info('Pipeline run %s finished in %.2fs' % (state['run'], state['time']))
+        return state
+
+
+def ingest(categories):
+    changed = False
+    for category, medias in fetch_news().items():
+        if category in categories and medias:
+            changed = ingest_news(category, medias) or changed
+    return changed
+
+
+def publish(category):
+    publish_snapshot(category)
+
+
+def build_pipeline(categories=None):
+    categories = categories or category_names()
+    stages = [Stage('ingest', ingest, [categories], always=True)]
+    for category in categories:
+        name = lambda stage: '%s:%s' % (category, stage)
+        stages += [
+            Stage(name('normalize'), normalize_news, [category], ['ingest'], group=category),
+            Stage(name('vectorize'), vectorize_news, [category], [name('normalize')], group=category),
+            Stage(name('cluster'), update_clusters, [category], [name('vectorize')], group=category),
+            Stage(name('rank'), set_hot_news, [category], [name('cluster')], group=category),
+            Stage(name('publish'), publish, [category], [name('rank')], group=category),
+        ]
+    return Pipeline(stages)
+
+
+def run_pipeline():
+    return build_pipeline().run()
+
+
+def run_worker(interval=REFRESH_INTERVAL):
+    """ Refreshes the news forever, bot processes pick up the published
+    snapshots themselves. /search queries are answered meanwhile.
+    """
+    threading.Thread(target=serve_search, name='search', daemon=True).start()
+    while True:
+        start = time.time()
+        try:
+            run_pipeline()
+        except Exception:
+            log.exception('Pipeline run failed')
+        time.sleep(max(0, interval - (time.time() - start)))
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+
+import importlib
+import re
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from settings import HOTNESS_SCORER, RARE_CLUSTER_COUNT
+
+import logging
+log = logging.getLogger(__name__)
+
+
+class Error(Exception):
+    pass
+
+
+class RankingError(Error):
+    pass
+
+
+def cluster_stats(df, now=None, weights=None):
+    """ Returns per-cluster `size`, mean `age` (ms) and distinct `sources`
+    computed in grouped passes. With `weights` (source -> weight) every
+    distinct source counts as its weight, unknown sources as 1.
+    """
+    now = now or datetime.now()
+    sources = cluster_sources(df).drop_duplicates()
+    sources['weight'] = sources['source'].map(weights or {}).fillna(1.).values
+    grouped = pd.DataFrame({
+        'cluster': df['cluster'].values,
+        'age': ((now - df['date']) / np.timedelta64(1, 'ms')).values,
+    }).groupby('cluster')
+    return pd.DataFrame({
+        'size': grouped.size(),
+        'age': grouped['age'].mean(),
+        'sources': sources.groupby('cluster')['weight'].sum(),
+    })
+
+
+def cluster_sources(df):
+    """ Returns (cluster, source) pairs including sources of suppressed
+    near-duplicates listed in `dup_sources`.
+    """
+    sources = pd.DataFrame({'cluster': df['cluster'].values, 'source': df['source'].values})
+    if 'dup_sources' not in df.columns:
+        return sources
+    duplicates = [
+        (cluster, source)
+        for cluster, dup_sources in zip(df['cluster'].values, df['dup_sources'].values)
+        if dup_sources for source in dup_sources.split('|')
+    ]
+    if not duplicates:
+        return sources
+    return pd.concat([sources, pd.DataFrame(duplicates, columns=['cluster', 'source'])], ignore_index=True)
+
+
+def default_hotness(stats):
+    """ Big, fresh clusters covered by many medias go first """
+    time_ind = stats['age'] / stats['age'].max()
+    return stats['size'] * (3 - time_ind) * (1 + stats['sources'] / 7.)
+
+
+SCORERS = {
+    'default': default_hotness,
+}
+
+
+def get_scorer(name=None):
+    """ Returns scorer registered as `name` or importable as `module.func`.
+
+    A scorer takes the `cluster_stats` frame and returns a score per
+    cluster, higher is hotter.
+    """
+    name = name or HOTNESS_SCORER
+    if name in SCORERS:
+        return SCORERS[name]
+    module, _, func = name.rpartition('.')
+    try:
+        return getattr(importlib.import_module(module), func)
+    except (ValueError, ImportError, AttributeError):
+        raise RankingError('unknown hotness scorer: %(name)r' % vars())
+
+
+def rank_clusters(df, top=10, scorer=None, weights=None):
+    """ Returns ids of the `top` hottest clusters, hottest first """
+    if df.empty:
+        return np.array([], dtype=int)
+    scores = get_scorer(scorer)(cluster_stats(df, weights=weights))
+    return scores.sort_values(ascending=False, kind='mergesort').index.values[:top]
+
+
+def excluded_news(df, terms):
+    """ Returns boolean mask of news whose text mentions any of `terms` """
+    if not terms or df.empty:
+        return np.zeros(len(df), dtype=bool)
+    pattern = '|'.join(re.escape(term) for term in terms)
+    return df['text'].str.contains(pattern).values.astype(bool)
+
+
+def rare_clusters(df, count=RARE_CLUSTER_COUNT):
+    """ Returns row positions of each of the `count` smallest clusters,
+    excluded news left out.
+    """
+    if 'excluded' in df.columns:
+        positions = np.flatnonzero(~df['excluded'].values.astype(bool))
+    else:
+        positions = np.arange(len(df))
+    groups, inverse, counts = np.unique(df['cluster'].values[positions], return_inverse=True, return_counts=True)
+    return [positions[inverse == group] for group in np.argsort(counts, kind='mergesort')[:count]]
+
+
+def centroid_medoids(labels, vectors):
+    """ Returns dict label -> position of the row closest to its group
+    centroid, for all groups at once.
+    """
+    labels = np.asarray(labels)
+    groups, inverse = np.unique(labels, return_inverse=True)
+    centroids = np.zeros((len(groups), vectors.shape[1]))
+    np.add.at(centroids, inverse, vectors)
+    similarities = (vectors * centroids[inverse]).sum(axis=1)
+    best = pd.Series(similarities).groupby(inverse).idxmax().values
+    return dict(zip(groups, best))
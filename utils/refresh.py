@@ -0,0 +1,473 @@
+# -*- coding: utf-8 -*-
+
+from datetime import timedelta, datetime
+from email.utils import parsedate
+from xml.etree import ElementTree
+import pandas as pd
+import numpy as np
+import os
+import logging
+from .feeds import fetcher, feed_source, load_feeds, FeedScheduler
+from .articles import downloader
+from .morph import normal_form, normalize_texts, lemma_cache
+from .storage import NEWS_COLUMNS, get_storage, load_news, save_news, dump_object, load_object, link_hash
+from .archive import get_archive
+from .clustering import get_clusterer, ClusterModel
+from .ranking import rank_clusters, centroid_medoids, excluded_news
+from .vectors import get_vectors
+from .dedup import MinHashLSH
+from .search import get_search_index
+from .categories import get_category
+from .bodies import get_body_store
+
+
+log = logging.getLogger(__name__)
+
+
+from settings import DEDUP_WINDOW, RARE_EXCLUDE_TERMS
+
+
+RSS_DATE_FORMAT = '%a, %d %b %Y %H:%M:%S'
+
+
+def clean_text(text):
+    return text.replace('&quot', '').replace('\n', '').replace('\xa0',' ')
+
+
+def parse_date(text):
+    """ Returns RFC 822 `text` as naive time of the feed timezone """
+    text = text.strip()
+    try:
+        return datetime.strptime(text[:-6], RSS_DATE_FORMAT)
+    except ValueError:
+        parsed = parsedate(text)
+        if parsed is None:
+            raise
+        return datetime(*parsed[:6])
+
+
+def _local_name(tag):
+    return tag.rpartition('}')[2].lower()
+
+
+def iter_items(chunks):
+    """ Yields dict tag -> text of every RSS item as soon as its closing
+    tag is parsed. Parsed items are cleared, so the tree never grows
+    beyond empty item stubs.
+    """
+    parser = ElementTree.XMLPullParser(events=('end',))
+
+    def parsed():
+        for _, element in parser.read_events():
+            if _local_name(element.tag) == 'item':
+                fields = {}
+                for child in element:
+                    fields.setdefault(_local_name(child.tag), child.text or '')
+                element.clear()
+                yield fields
+
+    fed = False
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode('utf-8')
+        parser.feed(chunk)
+        fed = True
+        for fields in parsed():
+            yield fields
+    if fed:
+        parser.close()
+        for fields in parsed():
+            yield fields
+
+
+def parse_rss(rss_url, raw_html=None, source=None):
+    """ Returns news of the feed at `rss_url`.
+
+    `raw_html` is the feed body or an iterable of its chunks; the feed
+    is fetched when it is not given. `source` defaults to the name
+    derived from the url.
+    """
+    if raw_html is None:
+        raw_html = fetcher.fetch(rss_url)
+        if raw_html is None:
+            return []
+    if isinstance(raw_html, (str, bytes)):
+        raw_html = [raw_html]
+
+    news_source = source or feed_source(rss_url)
+    if news_source is None:
+        log.warning('Unknown source of %s' % rss_url)
+        return []
+
+    items = []
+    try:
+        for fields in iter_items(raw_html):
+            try:
+                items.append((
+                    clean_text(fields['title']),
+                    fields['link'].strip(),
+                    clean_text(fields.get('description', '')),
+                    parse_date(fields['pubdate']),
+                ))
+            except (KeyError, ValueError):
+                continue
+    except ElementTree.ParseError as err:
+        log.warning('Failed to parse %s: %s' % (rss_url, err))
+
+    return [
+        [news_title, normal_form(news_title), news_link,
+         news_description, normal_form(news_description), news_pubdate, news_source]
+        for news_title, news_link, news_description, news_pubdate in items
+    ]
+
+
+def fresh_news(medias, links):
+    """ Returns news of the last day whose links are not in `links` """
+    known = set(links)
+    since = datetime.now() - timedelta(days=1)
+    fresh = []
+    for news in medias:
+        if news[2] in known:
+            continue
+        if news[5] > since:
+            fresh.append(news)
+            known.add(news[2])
+    return fresh
+
+
+def suppress_duplicates(fresh, lsh):
+    """ Splits near-duplicates of known articles off `fresh`.
+
+    Returns (originals, dict canonical link -> duplicate sources).
+    """
+    originals, sources = [], {}
+    for news in fresh:
+        canonical = lsh.canonical(news[2], news[1] + ' ' + news[4])
+        if canonical is None:
+            originals.append(news)
+        else:
+            sources.setdefault(canonical, []).append(news[6])
+    return originals, sources
+
+
+def _add_dup_sources(news_file, sources):
+    if 'dup_sources' not in news_file.columns:
+        news_file['dup_sources'] = ''
+    news_file['dup_sources'] = news_file['dup_sources'].fillna('')
+    mask = news_file['link'].isin(list(sources)).values
+    news_file.loc[mask, 'dup_sources'] = [
+        '|'.join(filter(None, [old] + sources[link]))
+        for old, link in zip(news_file['dup_sources'].values[mask], news_file['link'].values[mask])
+    ]
+    return news_file
+
+
+def _load_table(NEWS_LOCATION):
+    """ Returns the news table without full texts, which live in the
+    body store. Full texts of a table written before are moved there.
+    """
+    news_file = load_news(NEWS_LOCATION)
+    if 'full_text' not in news_file.columns:
+        return news_file
+    texts = news_file['full_text'].fillna('').values
+    news_file = news_file.drop('full_text', axis=1)
+    if len(news_file):
+        bodies = get_body_store(NEWS_LOCATION)
+        moved = bodies.extend(zip((link_hash(link) for link in news_file['link'].values), texts))
+        save_news(news_file, NEWS_LOCATION)
+        log.info('Moved %d full texts of %s to %r' % (moved, NEWS_LOCATION, bodies))
+    return news_file
+
+
+def _lsh_path(NEWS_LOCATION):
+    return os.path.splitext(NEWS_LOCATION)[0] + '.lsh.pkl'
+
+
+def _staged_location(NEWS_LOCATION):
+    return os.path.splitext(NEWS_LOCATION)[0] + '.ingest.csv'
+
+
+def ingest_news(category, medias):
+    """ Downloads full texts of fresh non-duplicate `medias` and stages
+    them for `normalize_news`. Returns `True` if anything changed.
+    """
+    NEWS_LOCATION = get_category(category).location
+
+    news_file = _load_table(NEWS_LOCATION)
+    staged = get_storage(_staged_location(NEWS_LOCATION))
+    staged_file = staged.load()
+    lsh = load_object(_lsh_path(NEWS_LOCATION)) or MinHashLSH()
+    lsh.prune(DEDUP_WINDOW)
+
+    known = list(news_file['link'].values) + list(staged_file['link'].values) + list(lsh.duplicates)
+    fresh = fresh_news(medias, known)
+    fresh, dup_sources = suppress_duplicates(fresh, lsh)
+
+    texts = downloader.download_all(news[2] for news in fresh)
+    for news in fresh:
+        news.append(texts[news[2]])
+        news.append('')
+
+    if fresh:
+        added = pd.DataFrame(fresh, columns=NEWS_COLUMNS)
+        added['date'] = pd.to_datetime(added['date'])
+        staged_file = pd.concat([staged_file, added], ignore_index=True)
+
+    if dup_sources:
+        staged_file = _add_dup_sources(staged_file, dup_sources)
+        save_news(_add_dup_sources(news_file, dup_sources), NEWS_LOCATION)
+        log.info('Suppressed %d near-duplicates' % sum(map(len, dup_sources.values())))
+
+    if not staged_file.empty:
+        staged.save(staged_file)
+
+    dump_object(lsh, _lsh_path(NEWS_LOCATION))
+    log.info('Staged %d %s news' % (len(fresh), category))
+    return bool(fresh or dup_sources)
+
+
+def normalize_news(category):
+    """ Lemmatizes staged news and merges them into the news table and
+    the archive. Returns `False` if nothing was staged.
+    """
+    NEWS_LOCATION = get_category(category).location
+    ALL_NEWS_LOCATION = get_category(category).archive_location
+
+    staged = get_storage(_staged_location(NEWS_LOCATION))
+    if not staged.exists():
+        return False
+    added = staged.load()
+    news_file = _load_table(NEWS_LOCATION)
+
+    added['full_text_preproc'] = normalize_texts(added['full_text'].values)
+    for column, default in (('cluster', 0), ('hot_topic', 0), ('dup_sources', '')):
+        if column in news_file.columns and column not in added.columns:
+            added[column] = default
+
+    # bodies and the archive first, the table keeps no full texts
+    bodies = get_body_store(NEWS_LOCATION)
+    bodies.extend(zip((link_hash(link) for link in added['link'].values), added['full_text'].values))
+    get_archive(ALL_NEWS_LOCATION).append(added)
+    get_search_index().add(category, added)
+
+    news_file = pd.concat([news_file, added.drop('full_text', axis=1)], ignore_index=True)
+    if 'dup_sources' in news_file.columns:
+        news_file['dup_sources'] = news_file['dup_sources'].fillna('')
+
+    news_file.drop_duplicates('link', inplace = True)
+    news_file = news_file[news_file['date'] > datetime.now() - timedelta(days=1)]
+
+    save_news(news_file, NEWS_LOCATION)
+    print('Added %d news' % len(added))
+
+    hashes = [link_hash(link) for link in news_file['link'].values]
+    if len(bodies) > 2 * len(hashes):
+        bodies.compact(hashes)
+
+    os.remove(staged.path)
+    return True
+
+
+def _upb_news(category, medias):
+    ingest_news(category, medias)
+    normalize_news(category)
+
+
+def relemmatize_archive(category='Kremlin', workers=None):
+    ALL_NEWS_LOCATION = get_category(category).archive_location
+
+    def relemmatize(df):
+        for column in ('header', 'text', 'full_text'):
+            df[column + '_preproc'] = normalize_texts(df[column].values, workers=workers)
+        return df
+
+    get_archive(ALL_NEWS_LOCATION).rewrite(relemmatize)
+    log.info('Relemmatized %s news archive' % category)
+
+
+def compact_archive(category='Kremlin', retention_days=None):
+    ALL_NEWS_LOCATION = get_category(category).archive_location
+
+    get_archive(ALL_NEWS_LOCATION).compact(retention_days=retention_days)
+
+
+def build_search_index(category='Kremlin'):
+    ALL_NEWS_LOCATION = get_category(category).archive_location
+
+    get_search_index().rebuild(category, get_archive(ALL_NEWS_LOCATION))
+
+
+feeds = load_feeds()
+scheduler = FeedScheduler(feeds)
+
+
+def source_weights():
+    weights = {}
+    for feed in feeds:
+        if feed.source is None:
+            continue
+        weights[feed.source] = max(feed.weight, weights.get(feed.source, 0))
+    return weights
+
+
+def fetch_news():
+    """ Polls feeds which are due, returns dict category -> items """
+    due = scheduler.due()
+    if not due:
+        return {}
+    sources = {feed.url: feed.source for feed in due}
+    results = fetcher.fetch_all([feed.url for feed in due], lambda url, chunks: parse_rss(url, chunks, sources[url]))
+    news = {}
+    for feed in due:
+        items = results[feed.url]
+        scheduler.update(feed, [item[2] for item in items] if items else None)
+        news.setdefault(feed.category, []).extend(items or [])
+    scheduler.save()
+    return news
+
+
+def upd_news():
+    log.info('____________ updating news _________________')
+
+    for category, medias in fetch_news().items():
+        _upb_news(category, medias)
+
+    log.info('Lemma cache: %r' % lemma_cache)
+
+    log.info('============= UPDATED NEWS ================')
+
+
+def _cluster_model_path(NEWS_LOCATION):
+    return os.path.splitext(NEWS_LOCATION)[0] + '.clusters.pkl'
+
+
+def vectorize_news(category='Kremlin'):
+    """ Caches TF-IDF term counts of articles which have none yet """
+    NEWS_LOCATION = get_category(category).location
+    df = _load_table(NEWS_LOCATION)
+    vectors = get_vectors(NEWS_LOCATION)
+    vectors.transform(df)
+    vectors.save(df['link'].values)
+
+
+def update_clusters(category='Kremlin', rebuild=False):
+    """ Assigns new articles to existing clusters.
+
+    All articles are re-clustered from scratch when `rebuild` is set,
+    when there is no saved model yet or when it is older than
+    `CLUSTER_REBUILD_INTERVAL`. Cluster ids are kept between runs.
+    """
+    NEWS_LOCATION = get_category(category).location
+    df = _load_table(NEWS_LOCATION)
+    if df.empty:
+        log.info('No %s news to cluster' % category)
+        return False
+    model = load_object(_cluster_model_path(NEWS_LOCATION))
+
+    if 'cluster' in df.columns:
+        previous = df['cluster'].fillna(0).values.astype(int)
+    else:
+        previous = np.zeros(len(df), dtype=int)
+    vectors = get_vectors(NEWS_LOCATION)
+
+    if rebuild or model is None or model.stale:
+        next_id = model.next_id if model is not None else 1
+        model, clusters = ClusterModel.build(vectors.transform(df), get_clusterer(), previous, next_id)
+        log.info('Clusters rebuilt: %r' % model)
+    else:
+        clusters = previous.copy()
+        new = np.flatnonzero(previous == 0)
+        if len(new):
+            clusters[new] = model.assign(vectors.transform(df.iloc[new]))
+        model.prune(set(clusters))
+        log.info('%d news assigned to clusters: %r' % (len(new), model))
+
+    df['cluster'] = clusters
+    save_news(df, NEWS_LOCATION)
+    vectors.save(df['link'].values)
+    dump_object(model, _cluster_model_path(NEWS_LOCATION))
+    log.info('Clusters updated')
+
+
+def set_hot_news(category='Kremlin'):
+    NEWS_LOCATION = get_category(category).location
+    df = _load_table(NEWS_LOCATION)
+    if df.empty or 'cluster' not in df.columns:
+        log.info('No clustered %s news to rank' % category)
+        return False
+    clust_rating = rank_clusters(df, top=10, weights=source_weights())
+
+    top = df[df['cluster'].isin(clust_rating)]
+    keys = top.groupby('cluster')['link'].agg(lambda links: link_hash(' '.join(sorted(links))))
+    cache = load_object(_representatives_path(NEWS_LOCATION), {})
+    representatives = {
+        cluster: cache[cluster] for cluster in clust_rating
+        if cache.get(cluster, (None,))[0] == keys[cluster]
+    }
+
+    stale = top[~top['cluster'].isin(list(representatives))]
+    if not stale.empty:
+        model = load_object(_cluster_model_path(NEWS_LOCATION))
+        embedded = None
+        if model is not None:
+            embedded = model.embed(get_vectors(NEWS_LOCATION).transform(stale))
+        positions = get_representatives(stale, embedded)
+        for cluster, position in positions.items():
+            representatives[cluster] = (keys[cluster], stale['link'].values[position])
+
+    links = pd.Series({representatives[cluster][1]: 10 - i for i, cluster in enumerate(clust_rating)})
+    df['hot_topic'] = df['link'].map(links).fillna(0).astype(int)
+    df['excluded'] = excluded_news(df, RARE_EXCLUDE_TERMS)
+    save_news(df, NEWS_LOCATION)
+    dump_object(representatives, _representatives_path(NEWS_LOCATION))
+    log.info('Hot news updated')
+
+
+def _representatives_path(NEWS_LOCATION):
+    return os.path.splitext(NEWS_LOCATION)[0] + '.representatives.pkl'
+
+
+def get_representatives(df, embedded=None):
+    """ Returns dict cluster -> position in `df` of the article closest
+    to its cluster centroid.
+
+    Uses `embedded` article vectors; falls back to the Levenshtein
+    medoid of headers when there are none.
+    """
+    if embedded is not None:
+        return centroid_medoids(df['cluster'].values, embedded)
+    representatives = {}
+    for cluster, positions in pd.Series(np.arange(len(df))).groupby(df['cluster'].values):
+        headers = df['header'].values[positions.values]
+        representatives[cluster] = positions.values[list(headers).index(get_cl(headers))]
+    return representatives
+
+
+def get_cl(cluster):
+    distances = np.zeros(shape=(len(cluster), len(cluster)))
+    for c in range(len(cluster)):
+        for d in range(len(cluster)):
+            distances[c][d] = distance(cluster[c], cluster[d])
+    a = distances.sum(axis=1)
+    return cluster[np.argmin(a)]
+
+
+def distance(a, b):
+    "Calculates the Levenshtein distance between a and b."
+    n, m = len(a), len(b)
+    if n > m:
+        a, b = b, a
+        n, m = m, n
+
+    current_row = range(n+1)
+    for i in range(1, m+1):
+        previous_row, current_row = current_row, [i]+[0]*n
+        for j in range(1,n+1):
+            add, delete, change = previous_row[j]+1, current_row[j-1]+1, previous_row[j-1]
+            if a[j-1] != b[i-1]:
+                change += 1
+            current_row[j] = min(add, delete, change)
+
+    return current_row[n]
+
+
@@ -0,0 +1,253 @@
+# -*- coding: utf-8 -*-
+
+import html
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+import numpy as np
+from redis.exceptions import RedisError
+
+from cache import SearchRequests
+from .morph import normal_form
+from .storage import link_hash
+from .i18n import langs
+
+from settings import SEARCH_INDEX_LOCATION, SEARCH_RESULTS, SEARCH_TIMEOUT, DEFAULT_LANGUAGE
+
+import logging
+log = logging.getLogger(__name__)
+
+
+K1 = 1.2
+B = 0.75
+COMMON_TERM_RATIO = 0.2
+EPOCH = datetime(1970, 1, 1)
+DATE_FILTER = re.compile(r'\b(since|until):(\d{4}-\d{2}-\d{2})\b')
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS docs (
+    id INTEGER PRIMARY KEY,
+    hash TEXT UNIQUE NOT NULL,
+    category TEXT NOT NULL,
+    date INTEGER NOT NULL,
+    length INTEGER NOT NULL,
+    header TEXT NOT NULL,
+    link TEXT NOT NULL,
+    source TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS docs_date ON docs (date);
+CREATE TABLE IF NOT EXISTS terms (
+    id INTEGER PRIMARY KEY,
+    term TEXT UNIQUE NOT NULL,
+    df INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS postings (
+    term INTEGER NOT NULL,
+    doc INTEGER NOT NULL,
+    tf INTEGER NOT NULL,
+    PRIMARY KEY (term, doc)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS stats (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+'''
+
+PREPROC_COLUMNS = ('header_preproc', 'text_preproc', 'full_text_preproc')
+
+
+def _timestamp(date):
+    return int((date - EPOCH).total_seconds())
+
+
+class SearchIndex(object):
+    """ Inverted index of the news archive in SQLite.
+
+    Documents are lemmatized `*_preproc` columns, postings keep term
+    frequencies and BM25 is computed by SQLite over the postings of the
+    query terms only, so a search never touches the archive tables.
+    The index lives with the archive in the refresh worker, which adds
+    news as they are archived and answers queries of bot processes
+    (`serve_search`). WAL mode lets reads go on during writes.
+    """
+
+    def __init__(self, location=SEARCH_INDEX_LOCATION):
+        self.location = location
+        self._local = threading.local()
+
+    def __repr__(self):
+        return '<%s(%s)>' % (type(self).__name__, self.location)
+
+    @property
+    def connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            directory = os.path.dirname(os.path.abspath(self.location))
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            connection = sqlite3.connect(self.location, timeout=30)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.executescript(SCHEMA)
+            self._local.connection = connection
+        return connection
+
+    def _stat(self, name):
+        row = self.connection.execute('SELECT value FROM stats WHERE name = ?', (name,)).fetchone()
+        return row[0] if row else 0
+
+    def add(self, category, df):
+        """ Indexes rows of `df` which are not in the index yet """
+        db = self.connection
+        hashes = [link_hash(link) for link in df['link'].values]
+        known = set()
+        for start in range(0, len(hashes), 500):
+            chunk = hashes[start:start + 500]
+            known.update(h for h, in db.execute(
+                'SELECT hash FROM docs WHERE hash IN (%s)' % ','.join('?' * len(chunk)), chunk))
+        positions = [i for i, h in enumerate(hashes) if h not in known]
+        if not positions:
+            return 0
+
+        texts = [' '.join(parts) for parts in zip(*(df[column].fillna('').values[positions] for column in PREPROC_COLUMNS))]
+        dates = df['date'].values[positions].astype('datetime64[s]').astype(np.int64)
+        with db:
+            terms = {}
+            total_length = 0
+            for i, text, date in zip(positions, texts, dates):
+                counts = Counter(text.split())
+                length = sum(counts.values())
+                total_length += length
+                doc = db.execute(
+                    'INSERT INTO docs (hash, category, date, length, header, link, source) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                    (hashes[i], category, int(date), length, df['header'].values[i], df['link'].values[i], df['source'].values[i]),
+                ).lastrowid
+                for term, tf in counts.items():
+                    terms.setdefault(term, []).append((doc, tf))
+
+            for term, postings in terms.items():
+                db.execute('INSERT OR IGNORE INTO terms (term, df) VALUES (?, 0)', (term,))
+                db.execute('UPDATE terms SET df = df + ? WHERE term = ?', (len(postings), term))
+                term_id = db.execute('SELECT id FROM terms WHERE term = ?', (term,)).fetchone()[0]
+                db.executemany('INSERT INTO postings (term, doc, tf) VALUES (?, ?, ?)',
+                               [(term_id, doc, tf) for doc, tf in postings])
+
+            for name, value in (('docs', len(positions)), ('length', total_length)):
+                db.execute('INSERT OR IGNORE INTO stats (name, value) VALUES (?, 0)', (name,))
+                db.execute('UPDATE stats SET value = value + ? WHERE name = ?', (value, name))
+        log.info('Indexed %d %s news in %r' % (len(positions), category, self))
+        return len(positions)
+
+    def search(self, terms, since=None, until=None, category=None, limit=SEARCH_RESULTS):
+        """ Returns up to `limit` (score, header, link, source, date) of
+        documents matching any of lemmatized `terms`, best first.
+
+        Terms found in more than `COMMON_TERM_RATIO` of documents add
+        little to BM25 but most of the postings to read, so they are
+        dropped when the query has rarer terms.
+        """
+        terms = list(set(terms))
+        n_docs = self._stat('docs')
+        if not terms or not n_docs:
+            return []
+        avgdl = float(self._stat('length')) / n_docs or 1.
+
+        db = self.connection
+        query = db.execute(
+            'SELECT id, df FROM terms WHERE term IN (%s)' % ','.join('?' * len(terms)), terms).fetchall()
+        if not query:
+            return []
+        rare = [(term, df) for term, df in query if df <= COMMON_TERM_RATIO * n_docs]
+        query = rare or [min(query, key=lambda term: term[1])]
+        weights = [(term, float(np.log(1. + (n_docs - df + .5) / (df + .5)))) for term, df in query]
+
+        where, params = [], []
+        if since is not None:
+            where.append('d.date >= ?')
+            params.append(_timestamp(since))
+        if until is not None:
+            where.append('d.date < ?')
+            params.append(_timestamp(until))
+        if category is not None:
+            where.append('d.category = ?')
+            params.append(category)
+
+        rows = db.execute('''
+            WITH q (term, idf) AS (VALUES %s)
+            SELECT SUM(q.idf * p.tf * (? + 1) / (p.tf + ? * (1 - ? + ? * d.length / ?))) AS score,
+                   d.header, d.link, d.source, d.date
+            FROM q
+            JOIN postings p ON p.term = q.term
+            JOIN docs d ON d.id = p.doc
+            %s
+            GROUP BY d.id
+            ORDER BY score DESC
+            LIMIT ?
+        ''' % (
+            ', '.join(['(?, ?)'] * len(weights)),
+            'WHERE ' + ' AND '.join(where) if where else '',
+        ), [value for weight in weights for value in weight] + [K1, K1, B, B, avgdl] + params + [limit])
+        return [(score, header, link, source, EPOCH + timedelta(seconds=date))
+                for score, header, link, source, date in rows]
+
+    def rebuild(self, category, archive):
+        """ Indexes every partition of `archive` """
+        for name in archive.partitions():
+            self.add(category, archive.partition(name).load())
+
+
+_indexes = {}
+
+
+def get_search_index(location=SEARCH_INDEX_LOCATION):
+    if location not in _indexes:
+        _indexes[location] = SearchIndex(location)
+    return _indexes[location]
+
+
+def parse_query(text):
+    """ Returns (lemmas, since, until) of a query like
+    `выборы since:2017-03-01 until:2017-04-01`
+    """
+    dates = dict(since=None, until=None)
+    for name, day in DATE_FILTER.findall(text):
+        dates[name] = datetime.strptime(day, '%Y-%m-%d')
+    if dates['until'] is not None:
+        dates['until'] += timedelta(days=1)
+    return normal_form(DATE_FILTER.sub(' ', text)).split(), dates['since'], dates['until']
+
+
+def search_news(text, limit=SEARCH_RESULTS, lang=DEFAULT_LANGUAGE):
+    """ Returns HTML list of archived news best matching `text` """
+    terms, since, until = parse_query(text)
+    results = get_search_index().search(terms, since=since, until=until, limit=limit)
+    if not results:
+        return langs[lang].gettext('NOTHING_FOUND_TEXT')
+    return '\n\n'.join(
+        '▶ <a href="%s">%s</a> %s, %s' % (
+            html.escape(link), html.escape(header), date.strftime('%Y-%m-%d'), html.escape(source))
+        for _, header, link, source, date in results
+    )
+
+
+def serve_search(timeout=SEARCH_TIMEOUT):
+    """ Answers /search queries of bot processes forever """
+    requests = SearchRequests()
+    while True:
+        try:
+            request = requests.pop(timeout)
+            if request is None:
+                continue
+            request_id, (text, lang), deadline = request
+            if deadline < time.time():
+                continue
+            requests.reply(request_id, search_news(text, lang=lang), timeout)
+        except RedisError as err:
+            log.warning('Failed to serve search: %s' % err)
+            time.sleep(timeout)
+        except Exception:
+            log.exception('Search failed')
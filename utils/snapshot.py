@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+
+import pickle
+import threading
+import time
+import zlib
+from datetime import datetime
+
+import numpy as np
+
+from .storage import link_hash
+from .bodies import get_body_store
+from .categories import get_category
+from .ranking import rare_clusters
+from .typeahead import HeadlineIndex
+
+import logging
+log = logging.getLogger(__name__)
+
+
+LATEST_NEWS_COUNT = 30
+BODY_COLUMNS = ['full_text', 'full_text_preproc']
+EXCERPT_WORDS = 100
+EXCERPT_POSITION = 7
+
+
+def news_excerpts(category, links, words=EXCERPT_WORDS):
+    """ Returns the first `words` words of the full texts of `links`
+    and one more, so the reader can tell whether the text goes on
+    """
+    bodies = get_body_store(get_category(category).location)
+    return [' '.join(bodies.get(link_hash(link), '').split()[:words + 1]) for link in links]
+
+
+class NewsSnapshot(object):
+    """ Read-only view of one category news table.
+
+    All derived views are computed once when the snapshot is built.
+    Request handlers share snapshots between threads and must never
+    modify the frames in place. Full texts are not kept; an `excerpt`
+    column in place of `full_text` holds their beginning, so the frame
+    carries everything an article is rendered from to other processes.
+    """
+
+    def __init__(self, category, frame, version):
+        self.category = category
+        self.version = version
+        self.created = datetime.now()
+
+        frame = frame.drop([column for column in BODY_COLUMNS if column in frame.columns], axis=1)
+        if 'excerpt' not in frame.columns:
+            frame.insert(EXCERPT_POSITION, 'excerpt', news_excerpts(category, frame['link'].values))
+        frame = frame.reset_index(drop=True)
+        if 'hot_topic' not in frame.columns:
+            frame['hot_topic'] = 0
+        self.frame = frame
+        self.hashes = np.array([link_hash(link) for link in frame['link'].values], dtype=object)
+        self.hot = frame[frame['hot_topic'] > 3].sort_values('hot_topic', ascending=False)
+        self.other_hot = frame[(frame['hot_topic'] < 4) & (frame['hot_topic'] > 0)].sort_values('hot_topic', ascending=False)
+        self.latest = frame.sort_values('date', ascending=False).head(LATEST_NEWS_COUNT)
+        self.rare = rare_clusters(frame) if 'cluster' in frame.columns else []
+        self.rare_positions = np.concatenate(self.rare) if self.rare else np.zeros(0, dtype=int)
+        self.headlines = HeadlineIndex(frame)
+
+    def __len__(self):
+        return len(self.frame)
+
+    def __repr__(self):
+        return '<%s(%s, version=%d, rows=%d)>' % (
+            type(self).__name__, self.category, self.version, len(self),
+        )
+
+
+class SnapshotRegistry(object):
+    """ Holds the current `NewsSnapshot` of every category.
+
+    `publish` builds a complete snapshot first and only then swaps the
+    reference, so readers get either the old or the new version.
+    `loader(category)` returns (frame, version or `None`) and is used
+    to build the first snapshot lazily.
+    """
+
+    def __init__(self, loader):
+        self._loader = loader
+        self._snapshots = {}
+        self._version = 0
+        self._lock = threading.Lock()
+
+    def _next_version(self):
+        version = max(int(time.time() * 1000), self._version + 1)
+        self._version = version
+        return version
+
+    def publish(self, category, frame=None, version=None):
+        if frame is None:
+            frame, version = self._loader(category)
+        with self._lock:
+            if version is None:
+                version = self._next_version()
+            self._version = max(self._version, version)
+        snapshot = NewsSnapshot(category, frame, version)
+        with self._lock:
+            current = self._snapshots.get(category)
+            if current is not None and current.version > version:
+                return current
+            self._snapshots[category] = snapshot
+        log.info('Published %r' % snapshot)
+        return snapshot
+
+    def get(self, category):
+        snapshot = self._snapshots.get(category)
+        if snapshot is None:
+            snapshot = self.publish(category)
+        return snapshot
+
+    def version(self, category):
+        snapshot = self._snapshots.get(category)
+        return snapshot.version if snapshot is not None else None
+
+
+def dump_frame(frame):
+    """ Returns compressed bytes of a snapshot frame for other processes """
+    return zlib.compress(pickle.dumps(frame, pickle.HIGHEST_PROTOCOL))
+
+
+def load_frame(payload):
+    return pickle.loads(zlib.decompress(payload))
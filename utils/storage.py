@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+
+import hashlib
+import os
+import pickle
+import tempfile
+
+import pandas as pd
+
+from settings import NEWS_STORAGE_BACKEND
+
+import logging
+log = logging.getLogger(__name__)
+
+
+NEWS_COLUMNS = ['header', 'header_preproc', 'link', 'text', 'text_preproc', 'date', 'source',
+    'full_text', 'full_text_preproc']
+TEXT_COLUMNS = [column for column in NEWS_COLUMNS if column != 'date'] + ['dup_sources']
+NUMERIC_COLUMNS = ['cluster', 'hot_topic', 'excluded']
+
+
+def link_hash(link):
+    return hashlib.md5(link.encode('utf-8')).hexdigest()
+
+
+class Error(Exception):
+    pass
+
+
+class StorageError(Error):
+    pass
+
+
+def atomic_write(path, write):
+    """ Calls `write(tmp)` and moves `tmp` over `path` """
+    directory = os.path.dirname(os.path.abspath(path))
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    fd, tmp = tempfile.mkstemp(prefix='.', suffix=os.path.splitext(path)[1], dir=directory)
+    os.close(fd)
+    try:
+        write(tmp)
+        os.replace(tmp, path)
+    except Exception:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def dump_object(obj, path):
+    def write(tmp):
+        with open(tmp, 'wb') as f:
+            pickle.dump(obj, f, pickle.HIGHEST_PROTOCOL)
+    atomic_write(path, write)
+
+
+def load_object(path, default=None):
+    if not os.path.exists(path):
+        return default
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+
+def coerce_news(df):
+    """ Casts news table columns to the types the rest of the code expects """
+    for column in TEXT_COLUMNS:
+        if column in df.columns:
+            df[column] = df[column].fillna('').astype(str)
+    if 'date' in df.columns:
+        df['date'] = pd.to_datetime(df['date'])
+    for column in NUMERIC_COLUMNS:
+        if column in df.columns:
+            df[column] = pd.to_numeric(df[column]).fillna(0)
+    return df
+
+
+class BaseStorage(object):
+    """ Stores one news table next to its `*_NEWS_LOCATION` setting.
+
+    The file name is the location with the backend extension. Writes go
+    to a temporary file in the same directory which then atomically
+    replaces the table, so readers never see a half-written file.
+    """
+
+    extension = None
+
+    def __init__(self, location):
+        self.location = location
+        self.path = os.path.splitext(location)[0] + self.extension
+
+    def __repr__(self):
+        return '<%s(%s)>' % (type(self).__name__, self.path)
+
+    def _read(self, path):
+        raise NotImplementedError
+
+    def _write(self, df, path):
+        raise NotImplementedError
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def _migrate(self):
+        legacy = os.path.splitext(self.location)[0] + '.csv'
+        if legacy == self.path or not os.path.exists(legacy):
+            return False
+        log.info('Migrating %s to %r' % (legacy, self))
+        self.save(coerce_news(pd.read_csv(legacy, header=0)))
+        return True
+
+    def load(self, columns=None):
+        """ Returns the table or an empty one with `NEWS_COLUMNS` """
+        if not self.exists() and not self._migrate():
+            return pd.DataFrame(columns=NEWS_COLUMNS)
+        df = self._read(self.path)
+        if columns is not None:
+            df = df[columns]
+        return df
+
+    def save(self, df):
+        try:
+            atomic_write(self.path, lambda tmp: self._write(df, tmp))
+        except Exception as err:
+            raise StorageError('Failed to save %r: %s' % (self, err))
+
+
+class CsvStorage(BaseStorage):
+
+    extension = '.csv'
+
+    def _read(self, path):
+        return coerce_news(pd.read_csv(path, header=0))
+
+    def _write(self, df, path):
+        df.to_csv(path, index=False)
+
+
+class FeatherStorage(BaseStorage):
+
+    extension = '.feather'
+
+    def _read(self, path):
+        return pd.read_feather(path)
+
+    def _write(self, df, path):
+        df.reset_index(drop=True).to_feather(path)
+
+
+class ParquetStorage(BaseStorage):
+
+    extension = '.parquet'
+
+    def _read(self, path):
+        return pd.read_parquet(path)
+
+    def _write(self, df, path):
+        df.to_parquet(path, index=False)
+
+
+BACKENDS = {
+    'csv': CsvStorage,
+    'feather': FeatherStorage,
+    'parquet': ParquetStorage,
+}
+
+
+def get_storage(location, backend=None):
+    backend = backend or NEWS_STORAGE_BACKEND
+    try:
+        klass = BACKENDS[backend]
+    except KeyError:
+        raise StorageError('unknown storage backend: %(backend)r' % vars())
+    return klass(location)
+
+
+def load_news(location, columns=None):
+    return get_storage(location).load(columns=columns)
+
+
+def save_news(df, location):
+    get_storage(location).save(df)
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+
+import re
+import threading
+from bisect import bisect_left
+from collections import OrderedDict
+
+import numpy as np
+
+from settings import INLINE_CACHE_SIZE
+
+import logging
+log = logging.getLogger(__name__)
+
+
+WORD = re.compile(r'\w+')
+
+
+def words(text):
+    return WORD.findall(text.lower())
+
+
+class HeadlineIndex(object):
+    """ Sorted-key prefix index over headers of one snapshot frame.
+
+    Every raw header word and every lemma of `header_preproc` becomes a
+    key pointing to its row. A query matches rows where each query word
+    is a prefix of some key; a prefix is a `bisect` range of the sorted
+    keys. Rows come back in `order`, hottest and newest first. Answers
+    are memoized in a bounded LRU for the lifetime of the index.
+    """
+
+    def __init__(self, frame, cache_size=INLINE_CACHE_SIZE):
+        self.frame = frame
+        keys = {}
+        for position, texts in enumerate(zip(frame['header'].values, frame['header_preproc'].values)):
+            for text in texts:
+                for word in words(str(text)):
+                    keys.setdefault(word, set()).add(position)
+        self.keys = sorted(keys)
+        self.rows = [keys[key] for key in self.keys]
+
+        order = np.lexsort((-frame['date'].values.astype('datetime64[s]').astype(np.int64),
+                            -frame['hot_topic'].values.astype(int))) if len(frame) else np.zeros(0, dtype=int)
+        self.order = list(order)
+        self.rank = {position: rank for rank, position in enumerate(self.order)}
+
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __repr__(self):
+        return '<%s(keys=%d, rows=%d)>' % (type(self).__name__, len(self.keys), len(self.order))
+
+    def _prefix(self, prefix):
+        rows = set()
+        for i in range(bisect_left(self.keys, prefix), bisect_left(self.keys, prefix + '\uffff')):
+            rows.update(self.rows[i])
+        return rows
+
+    def _match(self, query, limit):
+        prefixes = words(query)
+        if not prefixes:
+            return self.order[:limit]
+        rows = None
+        for prefix in sorted(set(prefixes), key=len, reverse=True):
+            matched = self._prefix(prefix)
+            rows = matched if rows is None else rows & matched
+            if not rows:
+                return []
+        return sorted(rows, key=self.rank.get)[:limit]
+
+    def suggest(self, query, limit, render=None):
+        """ Returns values of up to `limit` rows whose headers match `query`.
+
+        With `render`, returns (values, render(values)) pairs and the
+        rendered texts are memoized with the rows; `render` must not
+        change over the lifetime of the index.
+        """
+        key = (' '.join(words(query)), limit, render is not None)
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+        rows = list(self.frame.iloc[self._match(query, limit)].values)
+        if render is not None:
+            rows = [(row, render(row)) for row in rows]
+        with self._lock:
+            self._cache[key] = rows
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return rows
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+
+import os
+from collections import Counter
+
+import numpy as np
+import scipy.sparse as sp
+from sklearn.feature_extraction.text import CountVectorizer
+from sklearn.preprocessing import normalize
+
+from .storage import dump_object, load_object, link_hash
+
+import logging
+log = logging.getLogger(__name__)
+
+
+def cluster_texts(df):
+    """ Returns lemmatized texts the clustering works on """
+    norm_texts = (df['header_preproc'] + df['text_preproc'] + df['full_text_preproc']).values
+    return [text.replace('\xa0', ' ') for text in norm_texts]
+
+
+class IncrementalTfidf(object):
+    """ TF-IDF with a vocabulary and document frequencies which grow
+    with every new document.
+
+    Term indices are never reused, so the first `n` columns of a matrix
+    mean the same terms forever. Weighting matches `TfidfVectorizer`
+    defaults: smooth idf and l2 normalized rows.
+    """
+
+    def __init__(self):
+        self.vocabulary = {}
+        self.df = np.zeros(0, dtype=np.int64)
+        self.n_docs = 0
+        self._analyzer = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_analyzer'] = None
+        return state
+
+    @property
+    def analyzer(self):
+        if self._analyzer is None:
+            self._analyzer = CountVectorizer().build_analyzer()
+        return self._analyzer
+
+    def count(self, text):
+        """ Returns term (indices, counts) of `text` and updates statistics """
+        counts = Counter(self.analyzer(text))
+        for term in counts:
+            if term not in self.vocabulary:
+                self.vocabulary[term] = len(self.vocabulary)
+        indices = np.array([self.vocabulary[term] for term in counts], dtype=np.int32)
+        if len(self.vocabulary) > len(self.df):
+            self.df = np.concatenate([self.df, np.zeros(len(self.vocabulary) - len(self.df), dtype=np.int64)])
+        self.df[indices] += 1
+        self.n_docs += 1
+        return indices, np.array(list(counts.values()), dtype=np.float32)
+
+    @property
+    def idf(self):
+        return np.log((1. + self.n_docs) / (1. + self.df)) + 1
+
+    def weigh(self, rows):
+        """ Returns l2 normalized TF-IDF csr matrix of count `rows` """
+        if not rows:
+            return sp.csr_matrix((0, len(self.vocabulary)), dtype=np.float64)
+        indptr = np.cumsum([0] + [len(indices) for indices, _ in rows])
+        indices = np.concatenate([indices for indices, _ in rows] or [np.zeros(0, dtype=np.int32)])
+        data = np.concatenate([counts for _, counts in rows] or [np.zeros(0, dtype=np.float32)])
+        X = sp.csr_matrix((data, indices, indptr), shape=(len(rows), len(self.vocabulary)), dtype=np.float64)
+        return normalize(X.multiply(self.idf[None, :]).tocsr())
+
+
+class ArticleVectors(object):
+    """ Persistent TF-IDF model with term counts of every article cached
+    by link hash, stored next to a news table. Only articles which are
+    not in the cache are tokenized.
+    """
+
+    def __init__(self, location):
+        self.path = os.path.splitext(location)[0] + '.vectors.pkl'
+        state = load_object(self.path) or (IncrementalTfidf(), {})
+        self.tfidf, self.cache = state
+
+    def __repr__(self):
+        return '<%s(articles=%d, terms=%d)>' % (
+            type(self).__name__, len(self.cache), len(self.tfidf.vocabulary),
+        )
+
+    def transform(self, df):
+        """ Returns TF-IDF matrix with a row per article of `df` """
+        hashes = [link_hash(link) for link in df['link'].values]
+        missing = [i for i, h in enumerate(hashes) if h not in self.cache]
+        if missing:
+            texts = cluster_texts(df.iloc[missing])
+            for i, text in zip(missing, texts):
+                self.cache[hashes[i]] = self.tfidf.count(text)
+            log.info('Vectorized %d new articles: %r' % (len(missing), self))
+        return self.tfidf.weigh([self.cache[h] for h in hashes])
+
+    def save(self, links=None):
+        """ Saves the model keeping only cached articles from `links` """
+        if links is not None:
+            alive = set(link_hash(link) for link in links)
+            self.cache = {h: row for h, row in self.cache.items() if h in alive}
+        dump_object((self.tfidf, self.cache), self.path)
+
+
+_vectors = {}
+
+
+def get_vectors(location):
+    """ Returns shared `ArticleVectors` of the news table at `location` """
+    if location not in _vectors:
+        _vectors[location] = ArticleVectors(location)
+    return _vectors[location]